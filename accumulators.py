@@ -0,0 +1,382 @@
+"""
+Accumulators that total the outcomes of many particles in constant memory
+
+Every accumulator can add the particles of a finished ensemble, merge with
+another accumulator of the same shape (e.g. from another run or worker), and
+convert to and from a dictionary of arrays so it can be saved with numpy.
+"""
+import numpy as np
+
+from ensemble import HOPPING, DESTROYED, CAPTURED
+
+class DepositionMap:
+    """
+    Equal-area latitude/longitude histogram of final positions by fate
+
+    Latitude bins are evenly spaced in cos(phi), so every cell covers the same
+    area of the sphere and counts can be compared directly as densities.
+
+    Attributes:
+        n_lat: Number of latitude bins
+        n_lon: Number of longitude bins
+        counts: (3, n_lat, n_lon) array of number of particles in each cell,
+            indexed by fate code (HOPPING, DESTROYED, CAPTURED)
+    """
+    name = "deposition"
+
+    def __init__(self, n_lat=90, n_lon=180):
+        self.n_lat = n_lat
+        self.n_lon = n_lon
+        self.counts = np.zeros((3, n_lat, n_lon), dtype=np.int64)
+
+    def empty(self):
+        """
+        Create an empty map with the same bins
+        """
+        return DepositionMap(self.n_lat, self.n_lon)
+
+    def add(self, phi, beta, fate):
+        """
+        Add final positions of particles to the map
+
+        Args:
+            phi: Array of polar spherical coordinates (radians)
+            beta: Array of azimuthal spherical coordinates (radians)
+            fate: Array of fate codes from ensemble.py
+        """
+        # Equal-area bins in cos(phi), even bins in beta
+        lat = np.clip(((1 - np.cos(phi)) / 2 * self.n_lat).astype(np.int64),
+                      0, self.n_lat - 1)
+        lon = np.clip((np.mod(beta, 2*np.pi) / (2*np.pi) * self.n_lon)
+                      .astype(np.int64), 0, self.n_lon - 1)
+
+        # Count every fate and cell with a single bincount
+        flat = (np.asarray(fate, dtype=np.int64) * self.n_lat + lat) * \
+            self.n_lon + lon
+        self.counts += np.bincount(flat, minlength=self.counts.size) \
+            .reshape(self.counts.shape)
+
+    def add_ensemble(self, ensemble):
+        """
+        Add final positions of every particle in an ensemble
+        """
+        self.add(ensemble.phi, ensemble.beta, ensemble.fate)
+
+    def merge(self, other):
+        """
+        Add counts of another map with the same bins to this one
+        """
+        if other.counts.shape != self.counts.shape:
+            raise ValueError("Can only merge maps with the same bins")
+        self.counts += other.counts
+
+    def latitude_edges(self):
+        """
+        Get edges of latitude bins in degrees, from north to south
+        """
+        phi = np.arccos(1 - 2 * np.arange(self.n_lat + 1) / self.n_lat)
+        return 90 - np.rad2deg(phi)
+
+    def longitude_edges(self):
+        """
+        Get edges of longitude bins in degrees
+        """
+        return np.linspace(0, 360, self.n_lon + 1)
+
+    def density(self, fate=CAPTURED):
+        """
+        Get number of particles per steradian in each cell
+
+        Args:
+            fate: Fate code from ensemble.py, default CAPTURED
+
+        Return:
+            (n_lat, n_lon) array of particles per steradian
+        """
+        return self.counts[fate] / (4 * np.pi / (self.n_lat * self.n_lon))
+
+    def to_arrays(self):
+        """
+        Convert to a dictionary of arrays that can be saved with numpy
+        """
+        return {"counts": self.counts}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Create a map from a dictionary of arrays made by to_arrays
+        """
+        _, n_lat, n_lon = arrays["counts"].shape
+        deposition = cls(n_lat, n_lon)
+        deposition.counts = np.array(arrays["counts"], dtype=np.int64)
+        return deposition
+
+    def save(self, path):
+        """
+        Save the map to a .npz file
+        """
+        np.savez_compressed(path, **self.to_arrays())
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a map saved with save
+        """
+        with np.load(path) as arrays:
+            return cls.from_arrays(arrays)
+
+class Timeline:
+    """
+    Histogram of when particles were captured or destroyed, by time of flight
+
+    Every particle is counted once, in the time bin of its total time of
+    flight when it was removed, so cumulative counts and the number still in
+    flight at any time follow from the histogram. Particles still hopping at
+    a hop limit are counted at the time they were stopped. Optionally also
+    binned by equal-area latitude bins as in DepositionMap.
+
+    Attributes:
+        n_bins: Number of time bins
+        t_max: Time (s) of the end of the last bin. Particles removed later
+            are counted in the last bin.
+        n_lat: Number of latitude bins, 0 for none
+        counts: (3, n_bins) array of number of particles removed in each time
+            bin, indexed by fate code
+        lat_counts: (3, n_bins, n_lat) array of the same counts split by
+            latitude of final position
+    """
+    name = "timeline"
+
+    def __init__(self, n_bins=720, t_max=30 * 86400, n_lat=0):
+        """
+        Args:
+            n_bins: Number of time bins, default 720
+            t_max: Time (s) of the end of the last bin, default 30 days
+                (so hourly bins by default)
+            n_lat: Number of latitude bins, default 0 for none
+        """
+        self.n_bins = n_bins
+        self.t_max = float(t_max)
+        self.n_lat = n_lat
+        self.counts = np.zeros((3, n_bins), dtype=np.int64)
+        self.lat_counts = np.zeros((3, n_bins, n_lat), dtype=np.int64)
+
+    def empty(self):
+        """
+        Create an empty timeline with the same bins
+        """
+        return Timeline(self.n_bins, self.t_max, self.n_lat)
+
+    def add(self, elapsed, phi, fate):
+        """
+        Add times of flight and final positions of particles
+
+        Args:
+            elapsed: Array of total time of flight of each particle (s)
+            phi: Array of polar spherical coordinates (radians)
+            fate: Array of fate codes from ensemble.py
+        """
+        time_bin = np.minimum((np.asarray(elapsed) / self.t_max *
+                               self.n_bins).astype(np.int64), self.n_bins - 1)
+        fate = np.asarray(fate, dtype=np.int64)
+        flat = fate * self.n_bins + time_bin
+        self.counts += np.bincount(flat, minlength=self.counts.size) \
+            .reshape(self.counts.shape)
+        if self.n_lat:
+            lat = np.clip(((1 - np.cos(phi)) / 2 * self.n_lat)
+                          .astype(np.int64), 0, self.n_lat - 1)
+            self.lat_counts += np.bincount(
+                flat * self.n_lat + lat, minlength=self.lat_counts.size) \
+                .reshape(self.lat_counts.shape)
+
+    def add_ensemble(self, ensemble):
+        """
+        Add times of flight and final positions of every particle in an
+        ensemble
+        """
+        self.add(ensemble.elapsed, ensemble.phi, ensemble.fate)
+
+    def merge(self, other):
+        """
+        Add counts of another timeline with the same bins to this one
+        """
+        if other.t_max != self.t_max or \
+                other.lat_counts.shape != self.lat_counts.shape:
+            raise ValueError("Can only merge timelines with the same bins")
+        self.counts += other.counts
+        self.lat_counts += other.lat_counts
+
+    def time_edges(self):
+        """
+        Get edges of time bins in seconds
+        """
+        return np.linspace(0, self.t_max, self.n_bins + 1)
+
+    def cumulative(self, fate=CAPTURED):
+        """
+        Get number of particles removed with a fate by the end of each bin
+        """
+        return np.cumsum(self.counts[fate])
+
+    def in_flight(self):
+        """
+        Get number of particles still hopping at the end of each bin
+        """
+        return self.counts.sum() - self.cumulative(CAPTURED) - \
+            self.cumulative(DESTROYED)
+
+    def to_arrays(self):
+        """
+        Convert to a dictionary of arrays that can be saved with numpy
+        """
+        return {"counts": self.counts, "lat_counts": self.lat_counts,
+                "t_max": np.array(self.t_max)}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Create a timeline from a dictionary of arrays made by to_arrays
+        """
+        _, n_bins, n_lat = arrays["lat_counts"].shape
+        timeline = cls(n_bins, float(arrays["t_max"]), n_lat)
+        timeline.counts = np.array(arrays["counts"], dtype=np.int64)
+        timeline.lat_counts = np.array(arrays["lat_counts"], dtype=np.int64)
+        return timeline
+
+    def save(self, path):
+        """
+        Save the timeline to a .npz file
+        """
+        np.savez_compressed(path, **self.to_arrays())
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a timeline saved with save
+        """
+        with np.load(path) as arrays:
+            return cls.from_arrays(arrays)
+
+# Accumulators by name, used to load them back from saved arrays
+ACCUMULATORS = {
+    DepositionMap.name: DepositionMap,
+    Timeline.name: Timeline,
+}
+
+def accumulator_settings(accumulators):
+    """
+    Describe accumulators by their names, array shapes and any single values
+    such as bin limits, so runs are only combined with matching ones
+
+    Args:
+        accumulators: Iterable of accumulators (e.g. DepositionMap)
+
+    Return:
+        Dictionary by name of dictionaries of shapes and values, which can be
+        saved as JSON
+    """
+    return {acc.name: {key: value.tolist() if value.ndim == 0
+                       else list(value.shape) for key, value
+                       in acc.empty().to_arrays().items()}
+            for acc in accumulators}
+
+class Tally:
+    """
+    Total outcomes of many particles, with any number of accumulators
+
+    Attributes:
+        destroyed: Number of particles photodestroyed
+        captured: Number of particles captured
+        truncated: Number of particles still hopping at the hop limit
+        accumulators: Dictionary of accumulators by name
+    """
+    def __init__(self, accumulators=()):
+        """
+        Args:
+            accumulators: Iterable of accumulators (e.g. DepositionMap) to
+                fill, which are used as is
+        """
+        self.destroyed = 0
+        self.captured = 0
+        self.truncated = 0
+        self.accumulators = {acc.name: acc for acc in accumulators}
+
+    def empty(self):
+        """
+        Create an empty tally with empty copies of the same accumulators
+        """
+        return Tally([acc.empty() for acc in self.accumulators.values()])
+
+    @property
+    def perc_captured(self):
+        """
+        Proportion of removed particles that were captured, or None if none
+        """
+        total = self.destroyed + self.captured
+        return self.captured / total if total else None
+
+    def add_ensemble(self, ensemble):
+        """
+        Add the outcomes of every particle in a finished ensemble
+        """
+        self.destroyed += int(np.count_nonzero(ensemble.fate == DESTROYED))
+        self.captured += int(np.count_nonzero(ensemble.fate == CAPTURED))
+        self.truncated += int(np.count_nonzero(ensemble.fate == HOPPING))
+        for acc in self.accumulators.values():
+            acc.add_ensemble(ensemble)
+
+    def merge(self, other):
+        """
+        Add the outcomes of another tally with the same accumulators
+        """
+        if set(other.accumulators) != set(self.accumulators):
+            raise ValueError("Can only merge tallies with the same "
+                             "accumulators")
+        self.destroyed += other.destroyed
+        self.captured += other.captured
+        self.truncated += other.truncated
+        for name, acc in self.accumulators.items():
+            acc.merge(other.accumulators[name])
+
+    def to_arrays(self):
+        """
+        Convert to a dictionary of arrays that can be saved with numpy
+        """
+        arrays = {"counts": np.array([self.destroyed, self.captured,
+                                      self.truncated], dtype=np.int64)}
+        for name, acc in self.accumulators.items():
+            for key, value in acc.to_arrays().items():
+                arrays[f"{name}.{key}"] = value
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Create a tally from a dictionary of arrays made by to_arrays
+        """
+        # Group arrays of each accumulator by name
+        grouped = {}
+        for key in arrays:
+            if "." in key:
+                name, sub_key = key.split(".", 1)
+                grouped.setdefault(name, {})[sub_key] = arrays[key]
+
+        tally = cls([ACCUMULATORS[name].from_arrays(acc_arrays)
+                     for name, acc_arrays in grouped.items()])
+        tally.destroyed, tally.captured, tally.truncated = \
+            (int(count) for count in arrays["counts"])
+        return tally
+
+    def save(self, path):
+        """
+        Save the tally to a .npz file
+        """
+        np.savez_compressed(path, **self.to_arrays())
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a tally saved with save
+        """
+        with np.load(path) as arrays:
+            return cls.from_arrays(arrays)
@@ -0,0 +1,107 @@
+"""
+Run the simulation in batches until the proportion captured is known precisely
+"""
+import time
+from statistics import NormalDist
+
+import numpy as np
+
+from engines import make_ensemble
+from random_stream import RandomStream
+
+def wilson_interval(n_captured, n_total, confidence=0.95):
+    """
+    Calculate Wilson score interval for a proportion
+
+    Args:
+        n_captured: Number of particles captured
+        n_total: Number of particles either captured or destroyed
+        confidence: Float confidence level of interval, default 0.95
+
+    Return:
+        Tuple of lower and upper bound of proportion captured
+    """
+    if n_total == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    prop = n_captured / n_total
+    denominator = 1 + z**2 / n_total
+    center = (prop + z**2 / (2 * n_total)) / denominator
+    half_width = z * np.sqrt(prop * (1 - prop) / n_total +
+                             z**2 / (4 * n_total**2)) / denominator
+    return float(center - half_width), float(center + half_width)
+
+def adaptive_runs(start_option, model_option, precision=0.01, batch_size=1000,
+                  max_particles=10**6, max_time=None, confidence=0.95,
+                  seed=None, photoloss_timescale=None, engine="spherical"):
+    """
+    Simulate batches of particles until the proportion captured is precise
+
+    Stops as soon as the half width of the confidence interval is at most
+    precision, or when max_particles or max_time is used up. Each batch draws
+    from its own RandomStream spawned from seed, so results are reproducible.
+
+    Args:
+        start_option: String specifying method of choosing initial positions
+        model_option: String for model - either Butler's 1993 or 1997 paper
+        precision: Float target half width of confidence interval
+        batch_size: Number of particles simulated per batch
+        max_particles: Maximum number of particles to simulate in total
+        max_time: Optional maximum wall time in seconds, default no limit
+        confidence: Float confidence level of interval, default 0.95
+        seed: Integer seed for reproducible runs, default None
+        photoloss_timescale: Timescale for photodestruction (s), default
+            helpers.PHOTOLOSS_TIMESCALE
+        engine: String name of engine in engines.ENGINES
+
+    Return:
+        Dictionary with counts, proportion captured, confidence interval,
+        number of particles used, wall time and whether precision was met
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    if max_particles < batch_size:
+        raise ValueError("max_particles must be at least batch_size")
+
+    start_time = time.perf_counter()
+    seed_seq = np.random.SeedSequence(seed)
+    n_particles = 0
+    n_destroyed = 0
+    n_captured = 0
+    interval = (0.0, 1.0)
+    converged = False
+
+    while n_particles < max_particles:
+        # Run next batch with its own random numbers
+        size = min(batch_size, max_particles - n_particles)
+        rng = RandomStream(seed_seq.spawn(1)[0])
+        ensemble = make_ensemble(engine, start_option, model_option, size,
+                                 rng, photoloss_timescale)
+        batch_destroyed, batch_captured = ensemble.run()
+
+        # Update running counts and interval
+        n_particles += size
+        n_destroyed += batch_destroyed
+        n_captured += batch_captured
+        interval = wilson_interval(n_captured, n_captured + n_destroyed,
+                                   confidence)
+
+        # Stop if precise enough or out of time
+        if (interval[1] - interval[0]) / 2 <= precision:
+            converged = True
+            break
+        if max_time is not None and \
+                time.perf_counter() - start_time >= max_time:
+            break
+
+    n_total = n_destroyed + n_captured
+    return {
+        "destroyed": n_destroyed,
+        "captured": n_captured,
+        "perc_captured": n_captured / n_total if n_total else None,
+        "interval": interval,
+        "confidence": confidence,
+        "particles": n_particles,
+        "converged": converged,
+        "wall_time": time.perf_counter() - start_time,
+    }
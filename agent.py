@@ -3,6 +3,7 @@ Contains the Particle agent used in this simulation
 """
 import numpy as np
 import helpers as h
+from models import get_model
 
 class Particle:
     """
@@ -11,33 +12,50 @@ class Particle:
     Attributes:
         phi: Polar spherical coordinate as a float (in radians)
         beta: Azimuthal spherical coordinate as a float (in radians)
-        model_option: String for model - either from Butler's 1993 or 1997
+        model_option: String name of model
+        model: Model object from models.py giving temperature, launch angles
+            and capture
         temp: Yemperature of molecule in Kelvin at surface
         mass: Mass of molecule in kg
         launch_angle: Emergent angle of particle (in radians)
         velocity: Emergent velocity of particle hop (in m/s)
         hop_time: Time taken for a given particle hop
+        elapsed: Total time of flight of particle so far (s)
+        truncated: Whether a hop limit stopped the particle while still
+            hopping
         delta: Angle between start and final position (i.e. 'arc length')
+        rng: Source of random numbers, a RandomStream, Generator or the global
+            numpy.random state
+        photoloss_timescale: Timescale for loss by photodestruction (s)
+        tables: Optional HopTables of the model, used to look up hop
+            conditions instead of calculating them exactly
     """
-    def __init__(self, start_option, model_option):
+    def __init__(self, start_option, model_option, rng=None,
+                 photoloss_timescale=None, tables=None):
         # Set initial coordinates (default 70 degrees south)
         self.phi = np.pi / 2
         self.beta = 0
 
+        # Set source of random numbers (global state if none given)
+        self.rng = h.get_rng(rng)
+
         # If option is random, set initial coordinates as random
         if start_option == "random":
-            self.phi, self.beta = h.sample_spherical()
+            self.phi, self.beta = h.sample_spherical(rng=self.rng)
 
         # Initialize other state attributes
-        self.model_option = model_option
-        self.temp = h.get_temp(self.phi, model_option)
+        self.model = get_model(model_option)
+        self.model_option = self.model.name
         self.mass = h.MASS_WATER
+        self.photoloss_timescale = h.PHOTOLOSS_TIMESCALE \
+            if photoloss_timescale is None else photoloss_timescale
+        self.tables = tables
+        self.elapsed = 0.0
+        self.truncated = False
 
-        # Initialize motion attributes
-        self.launch_angle = h.get_angle(model_option)
-        self.velocity = h.velocity_rms(self.mass, self.temp)
-        self.hop_time = h.time_per_hop(self.velocity, self.launch_angle)
-        self.delta = h.get_delta(self.velocity, self.launch_angle)
+        # Initialize temperature and motion attributes
+        self.update_conditions()
+        self.delta = self.hop_delta()
 
     def is_photodestroy(self):
         """
@@ -48,37 +66,23 @@ class Particle:
         Return:
             Boolean of whether particle has been destroyed or not
         """
-        prob = 1 - np.exp(-self.hop_time / h.PHOTOLOSS_TIMESCALE)
-        return np.random.uniform(0, 1, size = prob.shape) < prob
+        prob = 1 - np.exp(-self.hop_time / self.photoloss_timescale)
+        return self.rng.uniform(0, 1, size = prob.shape) < prob
 
     def is_captured(self):
         """
         Check if given particle has been captured at polar regions
 
-        Probabilities of capture are binned as percentages.
-
         Return:
             Boolean whether particle is captured or not
         """
-        # Check if lying within polar region if 1993 model
-        if self.model_option == "1993":
-            if self.phi > (np.pi / 2):
-                return (np.pi - self.phi) < h.PHI_POLE
-            return self.phi < h.PHI_POLE
-
-        # Convert to degrees and center on zero
-        angle = abs(np.rad2deg(self.phi) - 90)
-
-        # Check probability of capture at different lattitude bins
-        if angle > 80:
-            return np.random.uniform(0, 100) < 11
-        if angle > 70:
-            return np.random.uniform(0, 100) < 4
-        if angle > 60:
-            return np.random.uniform(0, 100) < 0.9
-        if angle > 50:
-            return np.random.uniform(0,100) < 0.4
-        return False
+        return self.model.is_captured(self.phi, self.rng)
+
+    def truncate(self):
+        """
+        Mark particle as stopped by a hop limit while still hopping
+        """
+        self.truncated = True
 
     def update_phi(self, delta, psi):
         """
@@ -117,24 +121,46 @@ class Particle:
         Move a particle to its new position
         """
         # Calculate new delta
-        delta = h.get_delta(self.velocity, self.launch_angle)
+        delta = self.hop_delta()
         # Get new random direction of hop
-        psi = np.random.uniform(0, 2*np.pi)
+        psi = self.rng.uniform(0, 2*np.pi)
         # Store current value of phi
         phi_old = self.phi
         # Update phi and beta
         self.update_phi(delta, psi)
         self.update_beta(delta, phi_old, psi)
+        self.elapsed += self.hop_time
+
+    def hop_delta(self):
+        """
+        Get angle between start and final position of the next hop
+        """
+        if self.tables is not None:
+            return self.tables.delta(self.velocity, self.launch_angle)
+        return h.get_delta(self.velocity, self.launch_angle)
 
     def update_conditions(self):
         """
         Update the conditions for next hop
         """
-        # Calculate new temperature from new position
-        self.temp = h.get_temp(self.phi, self.model_option)
+        # Look up temperature and velocity at new position if tabulated
+        if self.tables is not None:
+            self.temp, self.velocity = self.tables.conditions(self.phi)
+            self.launch_angle = self.model.launch_angle(rng=self.rng)
+            self.hop_time = self.tables.hop_time(self.velocity,
+                                                 self.launch_angle)
+            return
+
+        # Calculate new temperature from new position, and local time if the
+        # model has one
+        if self.model.local_time:
+            self.temp = self.model.temperature(self.phi, self.beta,
+                                               self.elapsed)
+        else:
+            self.temp = self.model.temperature(self.phi)
         # Calculate velocity from new temperature
         self.velocity = h.velocity_rms(self.mass, self.temp)
         # Generate new launcha angle (random or pi/4 depending on model)
-        self.launch_angle = h.get_angle(self.model_option)
+        self.launch_angle = self.model.launch_angle(rng=self.rng)
         # Calculate new hop time with new velocity, launc angle
         self.hop_time = h.time_per_hop(self.velocity, self.launch_angle)
@@ -0,0 +1,491 @@
+"""
+Headless batch entry point for lunar hopping simulation
+
+Runs one simulation configured from command line arguments and/or a JSON or
+TOML config file, and writes the results as JSON without opening any plots.
+
+Example:
+    python batch.py --start random --model 1997 --run all_runs --seed 1 \
+        --output results.json
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from accumulators import DepositionMap, Timeline
+from adaptive import adaptive_runs
+from cache import ResultCache
+from checkpoint import checkpointed_tally
+from agent import Particle
+from engines import ENGINES, make_ensemble, supports_model
+from ensemble import HOPPING, DESTROYED, CAPTURED
+from instrument import Instrumentation
+from markov import CaptureSolver
+from models import MODELS
+from parallel import parallel_tally
+from random_stream import RandomStream
+from recorder import TrajectoryRecorder
+from response import response_curve
+from tables import get_tables
+import helpers as h
+
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+
+START_OPTIONS = ("random", "seventy_deg_south")
+MODEL_OPTIONS = tuple(MODELS)
+RUN_OPTIONS = ("journey", "one_run", "all_runs", "markov", "adaptive",
+               "response")
+FATE_NAMES = {HOPPING: "hopping", DESTROYED: "destroyed", CAPTURED: "captured"}
+
+# Settings used when not given in config file or on the command line
+DEFAULTS = {
+    "start": "random",
+    "model": "1997",
+    "run": "all_runs",
+    "particles": 100,
+    "runs": 50,
+    "seed": None,
+    "photoloss_timescale": h.PHOTOLOSS_TIMESCALE,
+    "workers": 1,
+    "engine": "spherical",
+    "instrument": False,
+    "precision": 0.01,
+    "confidence": 0.95,
+    "max_particles": 10**6,
+    "max_time": None,
+    "map_bins": (90, 180),
+    "map_output": None,
+    "timeline_bins": 720,
+    "timeline_max": 30 * 86400,
+    "timeline_lat": 0,
+    "timeline_output": None,
+    "trajectory_output": None,
+    "checkpoint": None,
+    "checkpoint_every": 10,
+    "cache": None,
+    "cache_size": 2**28,
+    "tabulate": None,
+    "max_hops": None,
+    "latitudes": (-70, 0),
+    "spread": 0.0,
+    "longitude": 0.0,
+    "output": None,
+}
+
+def load_config(path):
+    """
+    Load simulation settings from a JSON or TOML file
+
+    Args:
+        path: String path to config file, ending in .json or .toml
+
+    Return:
+        Dictionary of settings with the same names as DEFAULTS
+    """
+    if path.endswith(".toml"):
+        if tomllib is None:
+            raise ValueError("TOML config files need Python 3.11 or newer")
+        with open(path, "rb") as file:
+            config = tomllib.load(file)
+    else:
+        with open(path, encoding="utf-8") as file:
+            config = json.load(file)
+
+    # Check for settings that would otherwise be silently ignored
+    unknown = set(config) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown config settings: {sorted(unknown)}")
+    return config
+
+def parse_args(argv=None):
+    """
+    Parse command line arguments
+
+    Args:
+        argv: List of argument strings, default sys.argv
+
+    Return:
+        argparse Namespace with settings left as None if not given
+    """
+    parser = argparse.ArgumentParser(
+        description="Run the lunar hopping simulation without prompts")
+    parser.add_argument("--config", help="JSON or TOML file of settings")
+    parser.add_argument("--start", choices=START_OPTIONS,
+                        help="starting position option")
+    parser.add_argument("--model", choices=MODEL_OPTIONS,
+                        help="Butler model to use")
+    parser.add_argument("--run", choices=RUN_OPTIONS, help="type of run")
+    parser.add_argument("--particles", type=int,
+                        help="number of particles per run")
+    parser.add_argument("--runs", type=int,
+                        help="number of runs (all_runs only)")
+    parser.add_argument("--seed", type=int, help="seed for random numbers")
+    parser.add_argument("--photoloss-timescale", type=float,
+                        dest="photoloss_timescale",
+                        help="timescale for photodestruction (s)")
+    parser.add_argument("--workers", type=int,
+                        help="number of worker processes (all_runs only)")
+    parser.add_argument("--engine", choices=tuple(ENGINES),
+                        help="engine used to hop particles")
+    parser.add_argument("--instrument", action="store_true", default=None,
+                        help="report time per phase and hops to each fate")
+    parser.add_argument("--precision", type=float,
+                        help="target half width of interval (adaptive only)")
+    parser.add_argument("--confidence", type=float,
+                        help="confidence level of intervals (adaptive and "
+                             "response only)")
+    parser.add_argument("--max-particles", type=int, dest="max_particles",
+                        help="budget of particles (adaptive only)")
+    parser.add_argument("--max-time", type=float, dest="max_time",
+                        help="budget of wall time in seconds (adaptive only)")
+    parser.add_argument("--map-bins", type=int, nargs=2, dest="map_bins",
+                        metavar=("N_LAT", "N_LON"),
+                        help="number of bins of deposition map")
+    parser.add_argument("--map-output", dest="map_output",
+                        help="path of .npz deposition map (all_runs only)")
+    parser.add_argument("--timeline-bins", type=int, dest="timeline_bins",
+                        help="number of time bins of timeline")
+    parser.add_argument("--timeline-max", type=float, dest="timeline_max",
+                        help="time of flight (s) at end of last bin of "
+                             "timeline")
+    parser.add_argument("--timeline-lat", type=int, dest="timeline_lat",
+                        help="number of latitude bins of timeline, default "
+                             "none")
+    parser.add_argument("--timeline-output", dest="timeline_output",
+                        help="path of .npz timeline of when particles were "
+                             "captured or destroyed (all_runs only)")
+    parser.add_argument("--trajectory-output", dest="trajectory_output",
+                        help="path of binary file of every hop (one_run only)")
+    parser.add_argument("--checkpoint",
+                        help="path of .npz checkpoint to save progress to "
+                             "and resume from (all_runs only)")
+    parser.add_argument("--checkpoint-every", type=int,
+                        dest="checkpoint_every",
+                        help="number of runs between checkpoints")
+    parser.add_argument("--cache",
+                        help="directory of cached results of seeded runs, "
+                             "reused and extended when run again (all_runs "
+                             "only)")
+    parser.add_argument("--cache-size", type=int, dest="cache_size",
+                        help="largest size of cache in bytes, least recently "
+                             "used results are evicted past it")
+    parser.add_argument("--tabulate", type=float, metavar="TOLERANCE",
+                        help="look up hop conditions in tables accurate to "
+                             "this relative tolerance (journey, one_run and "
+                             "all_runs)")
+    parser.add_argument("--max-hops", type=int, dest="max_hops",
+                        help="safety limit on hops per particle, default "
+                             "none (particles still hopping at the limit are "
+                             "reported as truncated)")
+    parser.add_argument("--latitudes", type=float, nargs="+",
+                        help="starting latitudes in degrees, negative for "
+                             "south (response only)")
+    parser.add_argument("--spread", type=float,
+                        help="standard deviation in degrees of starts "
+                             "around each latitude (response only)")
+    parser.add_argument("--longitude", type=float,
+                        help="longitude of starts in degrees (response only)")
+    parser.add_argument("--output",
+                        help="path of JSON results file, default stdout")
+    return parser.parse_args(argv)
+
+def resolve_settings(args):
+    """
+    Combine defaults, config file and command line into final settings
+
+    Command line arguments take precedence over the config file, which takes
+    precedence over DEFAULTS.
+
+    Args:
+        args: argparse Namespace from parse_args
+
+    Return:
+        Dictionary of settings
+    """
+    settings = dict(DEFAULTS)
+    if args.config is not None:
+        settings.update(load_config(args.config))
+    for key in DEFAULTS:
+        value = getattr(args, key)
+        if value is not None:
+            settings[key] = value
+
+    # Check values that could have come from the config file
+    if settings["start"] not in START_OPTIONS:
+        raise ValueError(f"start must be one of {START_OPTIONS}")
+    if str(settings["model"]) not in MODEL_OPTIONS:
+        raise ValueError(f"model must be one of {MODEL_OPTIONS}")
+    if settings["run"] not in RUN_OPTIONS:
+        raise ValueError(f"run must be one of {RUN_OPTIONS}")
+    if settings["engine"] not in ENGINES:
+        raise ValueError(f"engine must be one of {tuple(ENGINES)}")
+    if not supports_model(settings["engine"], str(settings["model"])):
+        raise ValueError(f"engine {settings['engine']} cannot run model "
+                         f"{settings['model']}")
+    if settings["particles"] < 1:
+        raise ValueError("particles must be at least 1")
+    if settings["checkpoint_every"] < 1:
+        raise ValueError("checkpoint_every must be at least 1")
+    if settings["instrument"] and settings["workers"] != 1:
+        raise ValueError("instrument only works with a single worker")
+    settings["model"] = str(settings["model"])
+    return settings
+
+def get_settings_tables(settings):
+    """
+    Get lookup tables of hop conditions if settings ask for them
+
+    Args:
+        settings: Dictionary of settings
+
+    Return:
+        HopTables of the model, or None to calculate hop conditions exactly
+    """
+    if settings["tabulate"] is None:
+        return None
+    return get_tables(settings["model"], settings["tabulate"])
+
+def run_journey(settings, rng):
+    """
+    Follow the journey of a single particle until it is removed
+
+    Args:
+        settings: Dictionary of settings
+        rng: RandomStream or numpy Generator to draw random numbers from
+
+    Return:
+        Dictionary with coordinates of every hop and final fate
+    """
+    particle = Particle(settings["start"], settings["model"], rng,
+                        settings["photoloss_timescale"],
+                        get_settings_tables(settings))
+    phi = [float(particle.phi)]
+    beta = [float(particle.beta)]
+    fate = "hopping"
+
+    # Move particle until it is removed
+    for _ in h.hop_counter(settings["max_hops"]):
+        particle.move()
+        phi.append(float(particle.phi))
+        beta.append(float(particle.beta))
+
+        # Check for photodestruction
+        if particle.is_photodestroy():
+            fate = "destroyed"
+            break
+
+        # Check for capture
+        if particle.is_captured():
+            fate = "captured"
+            break
+
+        # Update particle hop conditions appropriately
+        particle.update_conditions()
+    else:
+        particle.truncate()
+
+    return {"hops": len(phi) - 1, "fate": fate, "phi": phi, "beta": beta}
+
+def run_one(settings, rng):
+    """
+    Do one run of the simulation and report final positions
+
+    Args:
+        settings: Dictionary of settings
+        rng: RandomStream or numpy Generator to draw random numbers from
+
+    Return:
+        Dictionary with counts and final coordinates and fate of particles
+    """
+    ensemble = make_ensemble(settings["engine"], settings["start"],
+                             settings["model"], settings["particles"], rng,
+                             settings["photoloss_timescale"],
+                             get_settings_tables(settings))
+    if settings["trajectory_output"] is None:
+        n_destroyed, n_captured = ensemble.run(settings["max_hops"])
+    else:
+        with TrajectoryRecorder(settings["trajectory_output"]) as recorder:
+            recorder.watch(ensemble)
+            n_destroyed, n_captured = ensemble.run(settings["max_hops"])
+    return {
+        "destroyed": n_destroyed,
+        "captured": n_captured,
+        "truncated": ensemble.n_hopping,
+        "phi": ensemble.phi.tolist(),
+        "beta": ensemble.beta.tolist(),
+        "fate": [FATE_NAMES[fate] for fate in ensemble.fate],
+    }
+
+def run_all(settings):
+    """
+    Do multiple runs of the simulation and total the outcomes
+
+    Args:
+        settings: Dictionary of settings
+
+    Return:
+        Dictionary with total counts and proportion captured
+    """
+    # Only fill a deposition map if it will be saved
+    accumulators = []
+    if settings["map_output"] is not None:
+        accumulators.append(DepositionMap(*settings["map_bins"]))
+    if settings["timeline_output"] is not None:
+        accumulators.append(Timeline(settings["timeline_bins"],
+                                     settings["timeline_max"],
+                                     settings["timeline_lat"]))
+
+    args = (settings["start"], settings["model"], settings["particles"],
+            settings["runs"], settings["seed"], settings["workers"],
+            settings["photoloss_timescale"], settings["engine"], accumulators,
+            settings["tabulate"], settings["max_hops"])
+    if settings["checkpoint"] is not None:
+        tally = checkpointed_tally(*args, path=settings["checkpoint"],
+                                   every=settings["checkpoint_every"])
+    elif settings["cache"] is not None:
+        tally = ResultCache(settings["cache"],
+                            settings["cache_size"]).tally(*args)
+    else:
+        tally = parallel_tally(*args)
+    if settings["map_output"] is not None:
+        tally.accumulators[DepositionMap.name].save(settings["map_output"])
+    if settings["timeline_output"] is not None:
+        tally.accumulators[Timeline.name].save(settings["timeline_output"])
+    return {
+        "destroyed": tally.destroyed,
+        "captured": tally.captured,
+        "truncated": tally.truncated,
+        "perc_captured": tally.perc_captured,
+    }
+
+def run_markov(settings):
+    """
+    Solve for the probability of capture with the Markov chain solver
+
+    Args:
+        settings: Dictionary of settings
+
+    Return:
+        Dictionary with proportion captured for the start option and the
+        proportion captured from every latitude
+    """
+    solver = CaptureSolver(settings["model"],
+                           photoloss_timescale=settings["photoloss_timescale"])
+    if settings["start"] == "random":
+        perc_captured = solver.capture_fraction_random()
+    else:
+        # Same starting point as Particle
+        perc_captured = float(solver.capture_fraction(np.pi / 2))
+    return {
+        "perc_captured": perc_captured,
+        "latitude": (90 - np.rad2deg(solver.centers)).tolist(),
+        "capture": solver.capture.tolist(),
+    }
+
+def run_adaptive(settings):
+    """
+    Simulate batches of particles until the proportion captured is precise
+
+    Args:
+        settings: Dictionary of settings, where particles is the batch size
+
+    Return:
+        Dictionary with counts, proportion captured and confidence interval
+    """
+    return adaptive_runs(
+        settings["start"], settings["model"], settings["precision"],
+        settings["particles"], settings["max_particles"],
+        settings["max_time"], settings["confidence"], settings["seed"],
+        settings["photoloss_timescale"], settings["engine"])
+
+def run_response(settings):
+    """
+    Find the proportion captured from each starting latitude in one ensemble
+
+    Args:
+        settings: Dictionary of settings, where particles is the number of
+            particles per latitude
+
+    Return:
+        Dictionary of counts, proportion captured and intervals per latitude
+    """
+    return response_curve(
+        settings["latitudes"], settings["model"], settings["particles"],
+        settings["seed"], settings["photoloss_timescale"], settings["engine"],
+        get_settings_tables(settings), settings["max_hops"],
+        settings["spread"], settings["longitude"], settings["confidence"])
+
+def run(settings):
+    """
+    Run the simulation described by settings
+
+    Args:
+        settings: Dictionary of settings
+
+    Return:
+        Dictionary of settings and results, ready to be written as JSON
+    """
+    start_time = time.perf_counter()
+    stats = Instrumentation()
+    if settings["instrument"]:
+        stats.__enter__()
+    try:
+        if settings["run"] == "all_runs":
+            results = run_all(settings)
+        elif settings["run"] == "markov":
+            results = run_markov(settings)
+        elif settings["run"] == "adaptive":
+            results = run_adaptive(settings)
+        elif settings["run"] == "response":
+            results = run_response(settings)
+        else:
+            rng = RandomStream(settings["seed"])
+            if settings["run"] == "journey":
+                results = run_journey(settings, rng)
+            else:
+                results = run_one(settings, rng)
+    finally:
+        stats.__exit__()
+
+    output = {
+        "settings": settings,
+        "results": results,
+        "wall_time": time.perf_counter() - start_time,
+    }
+    if settings["instrument"]:
+        output["instrumentation"] = stats.report()
+    return output
+
+def write_output(output, path):
+    """
+    Write results as JSON to a file, or stdout if no path given
+
+    Args:
+        output: Dictionary of results
+        path: String path of file to write, or None for stdout
+    """
+    if path is None:
+        json.dump(output, sys.stdout, indent=2)
+        print()
+        return
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(output, file, indent=2)
+
+def main(argv=None):
+    """
+    Run a headless simulation from command line arguments
+
+    Args:
+        argv: List of argument strings, default sys.argv
+    """
+    settings = resolve_settings(parse_args(argv))
+    write_output(run(settings), settings["output"])
+
+if __name__ == "__main__":
+    main()
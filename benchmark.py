@@ -0,0 +1,243 @@
+"""
+Benchmark speed and results of every start and model option
+
+Runs every combination of start option, model option and engine (plus the
+original one-at-a-time Particle loop for reference), records throughput, peak
+memory and proportion captured, and compares them against a stored baseline
+to flag performance or statistical regressions.
+
+Example:
+    python benchmark.py --output bench.json
+    python benchmark.py --baseline bench.json --output bench_new.json
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from agent import Particle
+from engines import ENGINES, make_ensemble, supports_model
+from random_stream import RandomStream
+import helpers as h
+
+START_OPTIONS = ("random", "seventy_deg_south")
+MODEL_OPTIONS = ("1993", "1997")
+# Name of the reference case that hops one Particle at a time
+PARTICLE_ENGINE = "particle"
+
+def run_particles(start_option, model_option, num_particles, rng):
+    """
+    Hop particles one at a time with the Particle class
+
+    Args:
+        start_option: String specifying method of choosing initial positions
+        model_option: String for model - either Butler's 1993 or 1997 paper
+        num_particles: Number of particles to run
+        rng: RandomStream or numpy Generator to draw random numbers from
+
+    Return:
+        Tuple of number of particles destroyed, captured and total hops
+    """
+    n_destroyed = 0
+    n_captured = 0
+    n_hops = 0
+    for _ in range(num_particles):
+        particle = Particle(start_option, model_option, rng)
+
+        # Move particles until they are removed
+        for _ in h.hop_counter():
+            particle.move()
+            n_hops += 1
+            if particle.is_photodestroy():
+                n_destroyed += 1
+                break
+            if particle.is_captured():
+                n_captured += 1
+                break
+            particle.update_conditions()
+    return n_destroyed, n_captured, n_hops
+
+def run_case(engine, start_option, model_option, num_particles, seed_seq):
+    """
+    Run one benchmark case
+
+    Args:
+        engine: String name of engine in engines.ENGINES, or PARTICLE_ENGINE
+        start_option: String specifying method of choosing initial positions
+        model_option: String for model - either Butler's 1993 or 1997 paper
+        num_particles: Number of particles to run
+        seed_seq: numpy SeedSequence for the case's random numbers
+
+    Return:
+        Tuple of number of particles destroyed, captured and total hops
+    """
+    rng = RandomStream(seed_seq)
+    if engine == PARTICLE_ENGINE:
+        return run_particles(start_option, model_option, num_particles, rng)
+    ensemble = make_ensemble(engine, start_option, model_option,
+                             num_particles, rng)
+    n_destroyed, n_captured = ensemble.run()
+    return n_destroyed, n_captured, int(ensemble.hops.sum())
+
+def benchmark(num_particles=20000, particle_fraction=0.01, seed=0,
+              engines=None, memory=True):
+    """
+    Benchmark every combination of start option, model option and engine
+
+    Args:
+        num_particles: Number of particles for each ensemble engine case
+        particle_fraction: Fraction of num_particles used for the much slower
+            Particle reference case
+        seed: Integer seed so every case is reproducible
+        engines: List of engine names, default all engines and the Particle
+            reference
+        memory: Whether to measure peak memory, which repeats each case
+            with tracemalloc on so it does not slow down the timed run
+
+    Return:
+        List of dictionaries of results, one per case
+    """
+    if engines is None:
+        engines = [PARTICLE_ENGINE, *ENGINES]
+
+    results = []
+    cases = [(engine, start_option, model_option) for engine in engines
+             for start_option in START_OPTIONS
+             for model_option in MODEL_OPTIONS
+             if engine == PARTICLE_ENGINE
+             or supports_model(engine, model_option)]
+    for seed_seq, (engine, start_option, model_option) in zip(
+            np.random.SeedSequence(seed).spawn(len(cases)), cases):
+        size = num_particles
+        if engine == PARTICLE_ENGINE:
+            size = max(1, int(num_particles * particle_fraction))
+
+        # Timed run
+        start_time = time.perf_counter()
+        n_destroyed, n_captured, n_hops = run_case(
+            engine, start_option, model_option, size, seed_seq)
+        wall_time = time.perf_counter() - start_time
+
+        # Repeat identical run to measure memory
+        peak_memory = None
+        if memory:
+            tracemalloc.start()
+            run_case(engine, start_option, model_option, size, seed_seq)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        n_total = n_destroyed + n_captured
+        perc_captured = n_captured / n_total if n_total else 0.0
+        results.append({
+            "engine": engine,
+            "start": start_option,
+            "model": model_option,
+            "particles": size,
+            "hops": n_hops,
+            "wall_time": wall_time,
+            "hops_per_second": n_hops / wall_time,
+            "particles_per_second": size / wall_time,
+            "peak_memory": peak_memory,
+            "destroyed": n_destroyed,
+            "captured": n_captured,
+            "perc_captured": perc_captured,
+            "std_err": float(np.sqrt(perc_captured * (1 - perc_captured) /
+                                     max(n_total, 1))),
+        })
+    return results
+
+def compare_to_baseline(results, baseline, perf_tolerance=0.2, z_limit=4):
+    """
+    Flag cases that are slower than, or statistically differ from, a baseline
+
+    Args:
+        results: List of dictionaries of results from benchmark
+        baseline: List of dictionaries of results from an earlier benchmark
+        perf_tolerance: Float fraction of baseline throughput that can be
+            lost before flagging, default 0.2
+        z_limit: Number of combined standard errors between proportions
+            captured before flagging, default 4
+
+    Return:
+        List of strings describing each regression found
+    """
+    def key(result):
+        return (result["engine"], result["start"], result["model"])
+    old_results = {key(result): result for result in baseline}
+
+    regressions = []
+    for result in results:
+        old = old_results.get(key(result))
+        if old is None:
+            continue
+        name = "/".join(key(result))
+
+        # Check throughput
+        if result["hops_per_second"] < \
+                (1 - perf_tolerance) * old["hops_per_second"]:
+            regressions.append(
+                f"{name}: {result['hops_per_second']:.0f} hops/s, "
+                f"baseline {old['hops_per_second']:.0f} hops/s")
+
+        # Check proportion captured
+        std_err = np.hypot(result["std_err"], old["std_err"])
+        diff = abs(result["perc_captured"] - old["perc_captured"])
+        if std_err > 0 and diff / std_err > z_limit:
+            regressions.append(
+                f"{name}: captured {result['perc_captured']:.4f}, "
+                f"baseline {old['perc_captured']:.4f} "
+                f"({diff / std_err:.1f} standard errors)")
+    return regressions
+
+def main(argv=None):
+    """
+    Run benchmarks from the command line
+
+    Args:
+        argv: List of argument strings, default sys.argv
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the simulation")
+    parser.add_argument("--particles", type=int, default=20000,
+                        help="number of particles per ensemble case")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed for random numbers")
+    parser.add_argument("--engines", nargs="+",
+                        choices=[PARTICLE_ENGINE, *ENGINES],
+                        help="engines to benchmark, default all")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip measuring peak memory")
+    parser.add_argument("--baseline",
+                        help="JSON results file to compare against")
+    parser.add_argument("--output", help="path of JSON results file")
+    args = parser.parse_args(argv)
+
+    results = benchmark(args.particles, seed=args.seed, engines=args.engines,
+                        memory=not args.no_memory)
+
+    # Print summary table
+    for result in results:
+        print(f"{result['engine']:>10} {result['start']:>17} "
+              f"{result['model']} {result['hops_per_second']:>12.0f} hops/s "
+              f"{result['particles_per_second']:>10.0f} particles/s "
+              f"captured {result['perc_captured']*100:.2f}%")
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"settings": vars(args), "results": results}, file,
+                      indent=2)
+
+    # Compare against baseline, failing if anything regressed
+    if args.baseline is not None:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+        regressions = compare_to_baseline(results, baseline)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+On-disk cache of the results of seeded campaigns of runs
+
+With a fixed seed the totals of a campaign are deterministic, so they are
+saved under a hash of everything that decides them: the settings, the physics
+constants in helpers.py and the source code of the simulation. Asking for the
+same campaign again returns the saved tally at once, and asking for more runs
+only does the extra ones, since the first runs of a campaign get the same
+random streams however many runs there are. The least recently used results
+are evicted once the cache grows past its size limit.
+
+Example:
+    cache = ResultCache(".hop_cache")
+    tally = cache.tally("random", "1997", 100, runs=50, seed=1)
+    tally = cache.tally("random", "1997", 100, runs=200, seed=1)  # 150 new
+"""
+from functools import lru_cache
+import hashlib
+import importlib
+import json
+import os
+
+import numpy as np
+
+from accumulators import Tally, accumulator_settings
+from jit import stream_kind
+from parallel import parallel_tally
+import helpers as h
+
+# Modules whose source decides the results of a run
+CODE_MODULES = ("helpers", "models", "thermal", "ensemble", "cartesian",
+                "hopskip", "jit", "engines", "tables", "random_stream",
+                "accumulators", "parallel")
+
+@lru_cache(maxsize=None)
+def code_version():
+    """
+    Get a hash of the source code of every module in CODE_MODULES
+    """
+    digest = hashlib.sha256()
+    for name in CODE_MODULES:
+        with open(importlib.import_module(name).__file__, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+def physics_constants():
+    """
+    Get the constants of helpers.py, which are the upper case names
+    """
+    return {name: np.asarray(value).tolist() for name, value in
+            sorted(vars(h).items()) if name.isupper()}
+
+def config_key(start_option, model_option, num_particles, seed,
+               photoloss_timescale, engine, accumulators, tabulate, max_hops):
+    """
+    Hash everything that decides the results of a campaign, except the
+    number of runs
+
+    Return:
+        String hex digest of the configuration
+    """
+    config = {
+        "start": start_option,
+        "model": str(model_option),
+        "particles": num_particles,
+        "seed": seed,
+        "photoloss_timescale": photoloss_timescale,
+        "engine": engine,
+        # The jit engine draws differently with and without numba
+        "jit_stream": stream_kind() if engine == "jit" else None,
+        "accumulators": accumulator_settings(accumulators),
+        "tabulate": tabulate,
+        "max_hops": max_hops,
+        "constants": physics_constants(),
+        "code": code_version(),
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True)
+                          .encode()).hexdigest()
+
+class ResultCache:
+    """
+    Directory of tallies of finished campaigns, keyed by configuration
+
+    Attributes:
+        directory: String path of directory of cached results
+        max_bytes: Largest total size of cached results in bytes
+        hits: Number of requests answered entirely from the cache
+        misses: Number of requests that needed new runs
+    """
+    def __init__(self, directory=".hop_cache", max_bytes=2**28):
+        """
+        Args:
+            directory: String path of directory of cached results, created if
+                needed, default .hop_cache
+            max_bytes: Largest total size of cached results in bytes, default
+                256 MiB
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        """
+        Get the path of the result file of a key
+        """
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def load(self, key):
+        """
+        Load a cached result, marking it as recently used
+
+        Return:
+            Tuple of Tally and number of runs, or None if not cached
+        """
+        path = self.path(key)
+        try:
+            with np.load(path) as arrays:
+                result = Tally.from_arrays(arrays), int(arrays["runs"])
+        except FileNotFoundError:
+            return None
+        # Access time is often not updated, so use modification time
+        os.utime(path)
+        return result
+
+    def save(self, key, tally, runs):
+        """
+        Save a result, replacing any earlier one in a single step, then evict
+        old results if over the size limit
+        """
+        path = self.path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as file:
+            np.savez_compressed(file, runs=runs, **tally.to_arrays())
+        os.replace(temp_path, path)
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        """
+        Delete least recently used results until under the size limit
+
+        Args:
+            keep: Optional path of a result never to delete, such as the one
+                just saved
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                os.remove(path)
+                total -= size
+
+    def size(self):
+        """
+        Get the total size of cached results in bytes
+        """
+        return sum(entry.stat().st_size for entry in
+                   os.scandir(self.directory) if entry.name.endswith(".npz"))
+
+    def clear(self):
+        """
+        Delete every cached result
+        """
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                os.remove(entry.path)
+
+    def tally(self, start_option, model_option, num_particles=100, runs=50,
+              seed=0, workers=None, photoloss_timescale=None,
+              engine="spherical", accumulators=(), tabulate=None,
+              max_hops=None):
+        """
+        Get the tally of a campaign, doing only the runs not already cached
+
+        Takes the same arguments as parallel.parallel_tally. A cached result
+        with more runs than asked for cannot be cut down, so fewer runs are
+        done from scratch, leaving the larger result cached. Without a seed
+        results are not reproducible, so nothing is cached.
+
+        Return:
+            Tally of outcomes of all runs
+        """
+        accumulators = tuple(accumulators)
+        args = (start_option, model_option, num_particles, runs, seed,
+                workers, photoloss_timescale, engine, accumulators, tabulate,
+                max_hops)
+        if seed is None:
+            return parallel_tally(*args)
+
+        key = config_key(start_option, model_option, num_particles, seed,
+                         photoloss_timescale, engine, accumulators, tabulate,
+                         max_hops)
+        cached = self.load(key)
+        if cached is not None and cached[1] == runs:
+            self.hits += 1
+            return cached[0]
+
+        self.misses += 1
+        if cached is None or cached[1] > runs:
+            total = parallel_tally(*args)
+            if cached is None:
+                self.save(key, total, runs)
+            return total
+
+        # Extend the cached campaign with the runs after it
+        total, done = cached
+        total.merge(parallel_tally(*args, skip=done))
+        self.save(key, total, runs)
+        return total
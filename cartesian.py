@@ -0,0 +1,120 @@
+"""
+Contains the CartesianEnsemble, which hops particles stored as unit vectors
+"""
+import numpy as np
+
+from ensemble import ParticleEnsemble
+from random_stream import RandomStream
+import helpers as h
+
+class CartesianEnsemble(ParticleEnsemble):
+    """
+    Particle ensemble with positions stored as 3-D unit vectors
+
+    Each hop rotates the position by delta towards a random tangent direction,
+    which needs no arccos of a ratio and no division by sin(phi), so it stays
+    stable at the poles. Phi is kept up to date since temperature and capture
+    depend on it, but beta is only converted from the unit vector when read.
+
+    Attributes:
+        x, y, z: Arrays of cartesian coordinates of particles on unit sphere
+        (other attributes as in ParticleEnsemble)
+    """
+    @property
+    def beta(self):
+        """
+        Array of azimuthal spherical coordinates (in radians)
+        """
+        return h.cartesian_to_spherical(self.x, self.y, self.z)[1]
+
+    @beta.setter
+    def beta(self, beta):
+        # Convert with current phi, which is always set first
+        self.x, self.y, self.z = h.coord_converter(self.phi, beta)
+
+    def beta_at(self, idx):
+        """
+        Get azimuthal spherical coordinates (radians) of some particles,
+        converting only those particles
+        """
+        return np.mod(np.arctan2(self.x[idx], self.z[idx]), 2*np.pi)
+
+    def move(self, idx):
+        """
+        Move particles to their new positions
+
+        Args:
+            idx: Array of indices of particles to move
+        """
+        # Calculate new delta
+        delta = self.hop_delta(idx)
+        x, y, z = self.x[idx], self.y[idx], self.z[idx]
+
+        # Get new random direction of hop by projecting a random vector onto
+        # the plane tangent to the current position, then rotate position by
+        # delta towards it
+        tangent = h.tangent_vector(x, y, z,
+                                   self.rng.standard_normal((3, idx.size)))
+        self.x[idx], self.y[idx], self.z[idx] = \
+            h.rotate_towards(x, y, z, tangent, delta)
+        self.phi[idx] = np.arccos(np.clip(self.y[idx], -1, 1))
+        self.hops[idx] += 1
+
+def ks_statistic(sample_1, sample_2):
+    """
+    Calculate the two-sample Kolmogorov-Smirnov statistic
+
+    Args:
+        sample_1: Array of samples from first distribution
+        sample_2: Array of samples from second distribution
+
+    Return:
+        Float maximum distance between the two empirical CDFs
+    """
+    values = np.sort(np.concatenate([sample_1, sample_2]))
+    cdf_1 = np.searchsorted(np.sort(sample_1), values, side="right")
+    cdf_2 = np.searchsorted(np.sort(sample_2), values, side="right")
+    return float(np.max(np.abs(cdf_1 / len(sample_1) - cdf_2 / len(sample_2))))
+
+def compare_hop_kernels(phi, model_option="1997", num_particles=100000,
+                        seed=None):
+    """
+    Compare the distribution of one hop from the spherical and cartesian
+    kernels starting from the same position
+
+    Compares landing phi and the angular distance travelled. The KS critical
+    value is the largest statistic expected from identical distributions at
+    the 0.1% significance level.
+
+    Args:
+        phi: Float polar spherical coordinate to start all particles at
+        model_option: String for model - either Butler's 1993 or 1997 paper
+        num_particles: Number of particles hopped with each kernel
+        seed: Integer seed for reproducible comparison, default None
+
+    Return:
+        Dictionary of KS statistic for landing phi and hop distance, and the
+        critical value of the statistic
+    """
+    rng_1, rng_2 = [RandomStream(seed_seq) for seed_seq in
+                    np.random.SeedSequence(seed).spawn(2)]
+    landing = []
+    distance = []
+    for ensemble in (ParticleEnsemble("random", model_option, num_particles,
+                                      rng_1),
+                     CartesianEnsemble("random", model_option, num_particles,
+                                       rng_2)):
+        ensemble.set_positions(phi, 0)
+        start = np.array(h.coord_converter(ensemble.phi, ensemble.beta))
+        ensemble.move(np.arange(num_particles))
+        end = np.array(h.coord_converter(ensemble.phi, ensemble.beta))
+        landing.append(ensemble.phi)
+        # Round away rounding error so constant hops compare as equal
+        distance.append(np.round(np.arccos(
+            np.clip(np.sum(start * end, axis=0), -1, 1)), 9))
+
+    return {
+        "phi": ks_statistic(*landing),
+        "distance": ks_statistic(*distance),
+        "critical": float(1.95 * np.sqrt(2 / num_particles)),
+    }
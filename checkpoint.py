@@ -0,0 +1,162 @@
+"""
+Checkpoint and resume long campaigns of many simulation runs
+
+Every run draws from its own random stream spawned from the campaign seed, so
+the only generator state needed to resume is the entropy of the campaign seed
+and which runs have finished. Both are saved with the tally of finished runs,
+and since tallies only add up counts, the resumed campaign gives exactly the
+same totals as one that was never interrupted.
+
+Example:
+    tally = checkpointed_tally("random", "1997", 1000, runs=500, seed=1,
+                               path="campaign.npz")
+"""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from accumulators import Tally, accumulator_settings
+from parallel import _simulate_run, reduce_tallies, spawn_seeds
+
+def campaign_settings(start_option, model_option, num_particles, runs,
+                      photoloss_timescale, engine, accumulators, tabulate,
+                      max_hops):
+    """
+    Describe a campaign, so a checkpoint is only resumed by the same one
+
+    Return:
+        JSON string of settings
+    """
+    return json.dumps({
+        "start": start_option,
+        "model": str(model_option),
+        "particles": num_particles,
+        "runs": runs,
+        "photoloss_timescale": photoloss_timescale,
+        "engine": engine,
+        "accumulators": accumulator_settings(accumulators),
+        "tabulate": tabulate,
+        "max_hops": max_hops,
+    }, sort_keys=True)
+
+def save_checkpoint(path, tally, completed, entropy, settings):
+    """
+    Save a checkpoint, replacing any earlier one in a single step
+
+    The checkpoint is written to a temporary file first, so an interruption
+    while saving leaves the previous checkpoint intact.
+
+    Args:
+        path: String path of .npz checkpoint file
+        tally: Tally of finished runs
+        completed: Boolean array of which runs have finished
+        entropy: Integer entropy of the campaign seed
+        settings: JSON string from campaign_settings
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        np.savez_compressed(file, completed=completed,
+                            entropy=np.array(str(entropy)),
+                            settings=np.array(settings), **tally.to_arrays())
+    os.replace(temp_path, path)
+
+def load_checkpoint(path):
+    """
+    Load a checkpoint saved with save_checkpoint
+
+    Return:
+        Tuple of tally of finished runs, boolean array of which runs have
+        finished, integer entropy of the campaign seed and JSON string of
+        settings
+    """
+    with np.load(path) as arrays:
+        return (Tally.from_arrays(arrays), arrays["completed"].copy(),
+                int(arrays["entropy"]), str(arrays["settings"]))
+
+def checkpointed_tally(start_option, model_option, num_particles=100,
+                       runs=50, seed=None, workers=None,
+                       photoloss_timescale=None, engine="spherical",
+                       accumulators=(), tabulate=None, max_hops=None,
+                       path="checkpoint.npz", every=10):
+    """
+    Do multiple runs of the simulation, saving progress as it goes
+
+    If a checkpoint already exists at path, the campaign carries on from it,
+    only doing the runs that had not finished. Otherwise a new campaign is
+    started. The checkpoint is kept once finished, so running again just
+    returns the saved tally.
+
+    Args:
+        start_option: String specifying method of choosing initial positions
+        model_option: String for model - either Butler's 1993 or 1997 paper
+        num_particles: Number of particles to run in simulation, default 100
+        runs: Number of runs of entire simulation, default 50
+        seed: Integer seed for the campaign, default None for fresh entropy.
+            When resuming, None uses the seed stored in the checkpoint, and
+            any other seed must match it.
+        workers: Number of worker processes, default one per CPU. A value of
+            1 runs everything in the current process.
+        photoloss_timescale: Timescale for photodestruction (s), default
+            helpers.PHOTOLOSS_TIMESCALE
+        engine: String name of engine in engines.ENGINES
+        accumulators: Iterable of accumulators (e.g. DepositionMap) whose
+            empty copies are filled across all runs
+        tabulate: Tolerance of lookup tables of hop conditions, default None
+            to calculate them exactly
+        max_hops: Optional safety limit on hops per particle, default None
+        path: String path of .npz checkpoint file
+        every: Number of finished runs between checkpoints, default 10
+
+    Return:
+        Tally of outcomes of all runs
+    """
+    if every < 1:
+        raise ValueError("every must be at least 1")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    accumulators = tuple(accumulators)
+    settings = campaign_settings(start_option, model_option, num_particles,
+                                 runs, photoloss_timescale, engine,
+                                 accumulators, tabulate, max_hops)
+
+    if os.path.exists(path):
+        total, completed, entropy, saved_settings = load_checkpoint(path)
+        if saved_settings != settings:
+            raise ValueError(f"Checkpoint {path} is for a different "
+                             f"campaign: {saved_settings}")
+        if seed is not None and \
+                np.random.SeedSequence(seed).entropy != entropy:
+            raise ValueError(f"Checkpoint {path} was started with a "
+                             "different seed")
+    else:
+        total = Tally([acc.empty() for acc in accumulators])
+        completed = np.zeros(runs, dtype=bool)
+        entropy = np.random.SeedSequence(seed).entropy
+        save_checkpoint(path, total, completed, entropy, settings)
+
+    # Seeds are spawned from the saved entropy, so each run gets the same
+    # random stream as it would have without the interruption
+    seed_seqs = spawn_seeds(entropy, runs)
+    todo = np.flatnonzero(~completed)
+    tasks = [(start_option, model_option, num_particles, seed_seqs[i],
+              photoloss_timescale, engine, accumulators, tabulate, max_hops)
+             for i in todo]
+
+    def merge_all(results):
+        for count, (i, tally) in enumerate(zip(todo, results), 1):
+            reduce_tallies(total, [tally])
+            completed[i] = True
+            if count % every == 0 or count == len(todo):
+                save_checkpoint(path, total, completed, entropy, settings)
+        return total
+
+    # Run in this process if only one worker, skipping pool startup
+    if workers == 1:
+        return merge_all(map(_simulate_run, tasks))
+
+    # Hand out runs in chunks so each worker gets a few at a time
+    chunksize = max(1, min(every, len(tasks) // (4 * workers)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return merge_all(pool.map(_simulate_run, tasks, chunksize=chunksize))
@@ -0,0 +1,55 @@
+"""
+Registry of engines that hop many particles at once
+"""
+from cartesian import CartesianEnsemble
+from ensemble import ParticleEnsemble
+from hopskip import HopSkipEnsemble
+from jit import JitEnsemble
+from models import get_model
+
+# Engines by name, each with the same interface as ParticleEnsemble
+ENGINES = {
+    "spherical": ParticleEnsemble,
+    "cartesian": CartesianEnsemble,
+    "hopskip": HopSkipEnsemble,
+    "jit": JitEnsemble,
+}
+
+def supports_model(engine, model_option):
+    """
+    Check whether the named engine can run a model
+
+    Engines limited to some models list their names in model_names.
+
+    Args:
+        engine: String name of engine in ENGINES
+        model_option: String name of model in models.MODELS, or a model object
+
+    Return:
+        Boolean of whether the engine runs the model
+    """
+    names = getattr(ENGINES[engine], "model_names", None)
+    return names is None or get_model(model_option).name in names
+
+def make_ensemble(engine, start_option, model_option, num_particles,
+                  rng=None, photoloss_timescale=None, tables=None):
+    """
+    Create an ensemble of particles with the named engine
+
+    Args:
+        engine: String name of engine in ENGINES
+        start_option: String specifying method of choosing initial positions
+        model_option: String for model - either Butler's 1993 or 1997 paper
+        num_particles: Number of particles in ensemble
+        rng: Optional RandomStream or Generator, default global state
+        photoloss_timescale: Timescale for photodestruction (s), default
+            helpers.PHOTOLOSS_TIMESCALE
+        tables: Optional HopTables of the model, default exact hop conditions
+
+    Return:
+        Ensemble of particles
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"engine must be one of {tuple(ENGINES)}")
+    return ENGINES[engine](start_option, model_option, num_particles, rng,
+                           photoloss_timescale, tables)
@@ -0,0 +1,297 @@
+"""
+Contains the ParticleEnsemble used to hop many particles at once
+"""
+import numpy as np
+import helpers as h
+from models import get_model
+
+# Fate codes for each particle in an ensemble
+HOPPING = 0
+DESTROYED = 1
+CAPTURED = 2
+
+class ParticleEnsemble:
+    """
+    Many particles stored as contiguous arrays and hopped together
+
+    Behaves like many independent instances of agent.Particle, but every live
+    particle is advanced in one batched step instead of one at a time.
+    Destroyed and captured particles are masked out of later steps.
+
+    Attributes:
+        phi: Array of polar spherical coordinates (in radians)
+        beta: Array of azimuthal spherical coordinates (in radians)
+        model_option: String name of model
+        model: Model object from models.py giving temperature, launch angles
+            and capture
+        temp: Array of temperatures of molecules in Kelvin at surface
+        mass: Mass of molecule in kg
+        launch_angle: Array of emergent angles of particles (in radians)
+        velocity: Array of emergent velocities of particle hops (in m/s)
+        hop_time: Array of times taken for the next particle hops
+        elapsed: Array of total time of flight of each particle so far (s)
+        fate: Array of fate codes (HOPPING, DESTROYED or CAPTURED)
+        hops: Array of number of hops taken by each particle
+        live: Array of indices of particles still hopping, in increasing
+            order, shrunk every step so later steps only touch live particles
+        recorder: Optional TrajectoryRecorder that records every hop
+        rng: Source of random numbers, a RandomStream, Generator or the global
+            numpy.random state
+        photoloss_timescale: Timescale for loss by photodestruction (s)
+        tables: Optional HopTables of the model, used to look up hop
+            conditions instead of calculating them exactly
+    """
+    def __init__(self, start_option, model_option, num_particles, rng=None,
+                 photoloss_timescale=None, tables=None):
+        # Set initial coordinates (default 70 degrees south)
+        self.phi = np.full(num_particles, np.pi / 2)
+        self.beta = np.zeros(num_particles)
+
+        # Set source of random numbers (global state if none given)
+        self.rng = h.get_rng(rng)
+
+        # If option is random, set initial coordinates as random
+        if start_option == "random":
+            self.phi, self.beta = h.sample_spherical(num_particles, self.rng)
+
+        # Initialize other state attributes
+        self.model = get_model(model_option)
+        self.model_option = self.model.name
+        self.mass = h.MASS_WATER
+        self.photoloss_timescale = h.PHOTOLOSS_TIMESCALE \
+            if photoloss_timescale is None else photoloss_timescale
+        self.fate = np.full(num_particles, HOPPING, dtype=np.int8)
+        self.hops = np.zeros(num_particles, dtype=np.int64)
+        self.elapsed = np.zeros(num_particles)
+        self.live = np.arange(num_particles)
+        self.recorder = None
+        self.tables = tables
+
+        # Initialize temperature and motion attributes for the first hop
+        self.temp = np.empty(num_particles)
+        self.velocity = np.empty(num_particles)
+        self.launch_angle = np.empty(num_particles)
+        self.hop_time = np.empty(num_particles)
+        self.update_conditions(np.arange(num_particles))
+
+    def __len__(self):
+        return self.phi.size
+
+    @property
+    def n_destroyed(self):
+        """
+        Number of particles that have been photodestroyed
+        """
+        return int(np.count_nonzero(self.fate == DESTROYED))
+
+    @property
+    def n_captured(self):
+        """
+        Number of particles that have been captured
+        """
+        return int(np.count_nonzero(self.fate == CAPTURED))
+
+    @property
+    def n_hopping(self):
+        """
+        Number of particles still hopping
+        """
+        return int(np.count_nonzero(self.fate == HOPPING))
+
+    def beta_at(self, idx):
+        """
+        Get azimuthal spherical coordinates (radians) of some particles
+        """
+        return self.beta[idx]
+
+    def set_positions(self, phi, beta):
+        """
+        Move every particle to given positions and update hop conditions
+
+        Args:
+            phi: Float or array of polar spherical coordinates (in radians)
+            beta: Float or array of azimuthal spherical coordinates
+        """
+        self.phi = np.zeros(len(self)) + phi
+        self.beta = np.zeros(len(self)) + beta
+        self.update_conditions(np.arange(len(self)))
+
+    def is_photodestroy(self, idx):
+        """
+        If particles are photodestroyed for their current hop times
+
+        Args:
+            idx: Array of indices of particles to check
+
+        Return:
+            Boolean array of whether each particle has been destroyed or not
+        """
+        prob = 1 - np.exp(-self.hop_time[idx] / self.photoloss_timescale)
+        return self.rng.uniform(0, 1, size=idx.size) < prob
+
+    def is_captured(self, idx):
+        """
+        Check if particles have been captured at polar regions
+
+        Args:
+            idx: Array of indices of particles to check
+
+        Return:
+            Boolean array of whether each particle is captured or not
+        """
+        return self.model.is_captured(self.phi[idx], self.rng)
+
+    def update_phi(self, idx, delta, psi):
+        """
+        Update values of phi based on given parameters
+
+        Args:
+            idx: Array of indices of particles to update
+            delta: Array of angles between start and final position
+            psi: Array of random angles between 0 and 2*pi for new direction
+        """
+        phi = self.phi[idx]
+        expression = (np.cos(phi) * np.cos(delta)) + \
+                        (np.sin(phi) * np.sin(delta) * np.cos(psi))
+        self.phi[idx] = np.arccos(np.clip(expression, -1, 1))
+
+    def update_beta(self, idx, delta, phi_old, psi):
+        """
+        Update values of beta based on given parameters
+
+        Args:
+            idx: Array of indices of particles to update
+            delta: Array of angles between start and final position
+            phi_old: Array of previous values of phi coordinate (polar angle)
+            psi: Array of random angles between 0 and 2*pi for new direction
+        """
+        # Calculate epsilon
+        phi = self.phi[idx]
+        expression = (np.cos(delta) - (np.cos(phi) * np.cos(phi_old))) / \
+                        (np.sin(phi) * np.sin(phi_old))
+        epsilon = np.arccos(np.clip(expression, -1, 1))
+
+        # Calculate beta value depending on magnitude of random angle psi
+        beta = self.beta[idx]
+        self.beta[idx] = h.wrap(np.where(psi > np.pi, beta + epsilon,
+                                         beta - epsilon))
+
+    def move(self, idx):
+        """
+        Move particles to their new positions
+
+        Args:
+            idx: Array of indices of particles to move
+        """
+        # Calculate new delta
+        delta = self.hop_delta(idx)
+        # Get new random direction of hop
+        psi = self.rng.uniform(0, 2*np.pi, size=idx.size)
+        # Store current value of phi
+        phi_old = self.phi[idx]
+        # Update phi and beta
+        self.update_phi(idx, delta, psi)
+        self.update_beta(idx, delta, phi_old, psi)
+        self.hops[idx] += 1
+
+    def hop_delta(self, idx):
+        """
+        Get angles between start and final positions of the next hops
+
+        Args:
+            idx: Array of indices of particles about to hop
+
+        Return:
+            Array of angles in radians
+        """
+        if self.tables is not None:
+            return self.tables.delta(self.velocity[idx],
+                                     self.launch_angle[idx])
+        return h.get_delta(self.velocity[idx], self.launch_angle[idx])
+
+    def update_conditions(self, idx):
+        """
+        Update the conditions for next hop
+
+        Args:
+            idx: Array of indices of particles to update
+        """
+        # Look up temperature and velocity at new position if tabulated
+        if self.tables is not None:
+            self.temp[idx], self.velocity[idx] = \
+                self.tables.conditions(self.phi[idx])
+            self.launch_angle[idx] = self.model.launch_angle(idx.size,
+                                                             self.rng)
+            self.hop_time[idx] = self.tables.hop_time(self.velocity[idx],
+                                                      self.launch_angle[idx])
+            return
+
+        # Calculate new temperature from new position, and local time if the
+        # model has one
+        if self.model.local_time:
+            self.temp[idx] = self.model.temperature(
+                self.phi[idx], self.beta_at(idx), self.elapsed[idx])
+        else:
+            self.temp[idx] = self.model.temperature(self.phi[idx])
+        # Calculate velocity from new temperature
+        self.velocity[idx] = h.velocity_rms(self.mass, self.temp[idx])
+        # Generate new launch angle (random or pi/4 depending on model)
+        self.launch_angle[idx] = self.model.launch_angle(idx.size, self.rng)
+        # Calculate new hop time with new velocity, launch angle
+        self.hop_time[idx] = h.time_per_hop(self.velocity[idx],
+                                            self.launch_angle[idx])
+
+    def step(self):
+        """
+        Advance every live particle by one hop
+
+        Only the active set of live particles is touched, so the cost of a
+        step shrinks with the number of particles still hopping rather than
+        staying proportional to the whole ensemble.
+
+        Return:
+            Integer number of particles still hopping after the step
+        """
+        idx = self.live
+        if idx.size == 0:
+            return 0
+
+        self.move(idx)
+        self.elapsed[idx] += self.hop_time[idx]
+        moved = idx
+
+        # Check for photodestruction
+        destroyed = self.is_photodestroy(idx)
+        self.fate[idx[destroyed]] = DESTROYED
+        idx = idx[~destroyed]
+
+        # Check for capture among survivors
+        captured = self.is_captured(idx)
+        self.fate[idx[captured]] = CAPTURED
+        idx = idx[~captured]
+
+        # Record hop before hop times are updated
+        if self.recorder is not None:
+            self.recorder.record(self, moved)
+
+        # Update particle conditions for next hop
+        self.update_conditions(idx)
+        self.live = idx
+        return idx.size
+
+    def run(self, max_hops=None):
+        """
+        Hop all particles until every one is removed
+
+        Args:
+            max_hops: Optional integer safety limit on the number of hops,
+                default None for no limit. Particles still hopping at the
+                limit are left HOPPING and counted by n_hopping.
+
+        Return:
+            Tuple of number of particles destroyed and captured
+        """
+        for _ in h.hop_counter(max_hops):
+            if self.step() == 0:
+                break
+        return self.n_destroyed, self.n_captured
@@ -2,8 +2,9 @@
 Helper functions and constants
 """
 
+import itertools
+
 import numpy as np
-import matplotlib.pyplot as plt
 
 # Acceleration due to gravity at the moon (m/s^2)
 G_MOON = 1.625
@@ -31,17 +32,56 @@ ANGLE = np.pi / 4
 T_0 = 151
 T_1 = 161.7
 N = 0.59
+# Temperatures of the subsolar point and nightside in local time model
+T_NOON = 390
+T_NIGHT = 100
+# Time for the moon to turn once relative to the sun (s)
+SYNODIC_MONTH = 29.530589 * 86400
+# Probability (%) of capture in 1997 model, binned by degrees from equator
+# (see models.Butler1997)
+CAPTURE_BINS = ((80, 11), (70, 4), (60, 0.9), (50, 0.4))
+
+def get_rng(rng=None):
+    """
+    Get the source of random numbers to draw from
+
+    Args:
+        rng: Optional RandomStream or Generator, default None for global state
+
+    Return:
+        The given source, or the numpy.random module if none was given
+    """
+    return np.random if rng is None else rng
+
+def hop_counter(max_hops=None):
+    """
+    Count hops of a simulation, up to an optional limit
+
+    Args:
+        max_hops: Optional integer maximum number of hops, default None to
+            count forever (until particles are removed)
 
-def sample_spherical():
+    Return:
+        Iterable of hop numbers starting from zero
+    """
+    return itertools.count() if max_hops is None else range(max_hops)
+
+def sample_spherical(size=None, rng=None):
     """
     Generate a random spherical coordinate in 3-dimensional space
 
+    Args:
+        size: Optional integer number of coordinates to generate, default
+            None for a single coordinate
+        rng: Optional RandomStream or Generator, default global state
+
     Returns:
         phi: Polar spherical coordinate between 0 and pi
         beta: Azimuthal spherical coordinate between 0 and 2*pi
     """
-    # Generate a 3-dimnensional vector and normalize
-    vec = np.random.randn(3)
+    rng = get_rng(rng)
+    # Generate a 3-dimnensional vector (one per column) and normalize
+    vec = rng.standard_normal(3 if size is None else (3, size))
     vec /= np.linalg.norm(vec, axis=0)
     # Assign Cartesian coordinates from vector
     x, y, z = vec
@@ -128,30 +168,17 @@ def get_delta(v_initial, launch_angle):
     d_water = distance_per_hop(v_initial, launch_angle)
     return d_water / R_MOON
 
-def get_temp(phi, model_option):
-    """
-    Calculate surface temperature at given latitude based on thermal model
-
-    Arg:
-        phi: Polar spherical coordinate between 0 and pi
-    
-    Return:
-        Float of temperature in Kelvin
+def latitude_to_phi(latitude):
     """
-    if model_option == "1993":
-        return 500
-    return T_0 + T_1 * np.power(np.cos(phi - np.pi/2), N)
+    Convert latitude to the polar spherical coordinate phi
 
-def get_angle(model_option):
-    """
-    Generate a random emergent angle between zero and pi/2
+    Args:
+        latitude: Float latitude in degrees, negative for south
 
-    Returns:
-        Float of angle in radians
+    Return:
+        Float polar spherical coordinate between 0 and pi
     """
-    if model_option == "1993":
-        return np.pi / 4
-    return np.arccos(np.random.uniform(0, 1))
+    return np.deg2rad(90 - np.asarray(latitude, dtype=float))
 
 def coord_converter(phi, beta):
     """
@@ -170,55 +197,61 @@ def coord_converter(phi, beta):
     z = np.sin(phi) * np.cos(beta)
     return (x, y, z)
 
-def plot_sphere(ax):
+def tangent_vector(x, y, z, normal):
     """
-    Plot a unit sphere in 3-D space
+    Project random vectors onto the planes tangent to points on the unit sphere
 
-    Arg:
-        ax: Axes on which to plot
-    """
-    # Create a meshgrid of phi and beta values
-    phi, beta = np.mgrid[0.0:2.0*np.pi:100j, 0.0:np.pi:50j]
+    The projection of a standard normal vector is a 2-D standard normal vector
+    in the tangent plane, so its direction is uniformly random and its length
+    is Rayleigh distributed.
 
-    # Convert to cartesian
-    (x, y, z) = coord_converter(beta, phi)
+    Args:
+        x, y, z: Floats or arrays of positions on the unit sphere
+        normal: (3, ...) array of standard normal draws, such as from
+            rng.standard_normal((3, size))
 
-    # Plot the 3D sphere in blue color
-    ax.plot_surface(x, y, z, color='#EEEEEE', alpha=0.5, linewidth=0)
+    Returns:
+        Tuple of x, y and z components of the tangent vectors and their
+        lengths
+    """
+    t_x, t_y, t_z = normal
+    dot = t_x * x + t_y * y + t_z * z
+    t_x, t_y, t_z = t_x - dot * x, t_y - dot * y, t_z - dot * z
+    return t_x, t_y, t_z, np.sqrt(t_x**2 + t_y**2 + t_z**2)
 
-    # Plot two circles representing poles from Butler 1993
-    circle_beta = np.linspace(0, 2*np.pi, 100)
-    circle1_phi = np.full(100, PHI_POLE)
-    circle2_phi = np.full(100, np.pi - PHI_POLE)
+def rotate_towards(x, y, z, tangent, angle):
+    """
+    Rotate points on the unit sphere along great circles towards tangent
+    vectors
 
-    ax.plot(*coord_converter(circle1_phi, circle_beta))
-    ax.plot(*coord_converter(circle2_phi, circle_beta))
+    Args:
+        x, y, z: Floats or arrays of positions on the unit sphere
+        tangent: Tuple of components and lengths of tangent vectors, from
+            tangent_vector
+        angle: Float or array of angles to rotate by (radians)
 
-def plot_points(ax, phi, beta, color='r'):
+    Returns:
+        x, y, and z positions after rotating
     """
-    Plot a point on a sphere
+    t_x, t_y, t_z, norm = tangent
+    cos_angle = np.cos(angle)
+    sin_angle = np.sin(angle) / norm
+    return (x * cos_angle + t_x * sin_angle, y * cos_angle + t_y * sin_angle,
+            z * cos_angle + t_z * sin_angle)
 
-    Arg:
-        ax: Axes on which to plot
-        phi: Float polar spherical coordinate (radians)
-        beta: Float azimuthal spherical coordinate (radians)
-        color: Character for color of point, default red
+def cartesian_to_spherical(x, y, z):
     """
-    ax.scatter(*coord_converter(phi, beta), color=color, s = 10)
+    Convert from cartesian to spherical coordinate system
 
-def plot_finish(ax, title):
-    """
-    Finish up a plot in 3-D space
+    Inverse of coord_converter for points on the unit sphere.
 
-    Arg:
-        ax: Axes on which to plot
-        title: String for the title of the figure
-    """
-    # Set labels and title
-    ax.set_xlabel('X')
-    ax.set_ylabel('Y')
-    ax.set_zlabel('Z')
-    ax.set_title(title)
+    Args:
+        x, y, z: Float positions between -1 and 1
 
-    # Show the plot
-    plt.show()
+    Returns:
+        phi: Polar spherical coordinate between 0 and pi
+        beta: Azimuthal spherical coordinate between 0 and 2*pi
+    """
+    phi = np.arccos(np.clip(y, -1, 1))
+    beta = np.mod(np.arctan2(x, z), 2*np.pi)
+    return phi, beta
@@ -0,0 +1,166 @@
+"""
+Contains the HopSkipEnsemble, a fast engine for Butler's 1993 model
+
+In the 1993 model temperature and launch angle are the same everywhere, so
+every hop has the same arc length and hop time, and the chance of surviving
+photodestruction is the same on every hop. A particle's fate only depends on
+how many hops it survives, which is drawn once from a geometric distribution,
+and on when its random walk first lands in a polar region. Far from the poles
+many hops at once are replaced by a single jump drawn from the diffusion
+kernel of the walk, while near the poles particles take exact single hops.
+
+Example:
+    ensemble = HopSkipEnsemble("random", "1993", 100000)
+    n_destroyed, n_captured = ensemble.run()
+"""
+import numpy as np
+
+from cartesian import CartesianEnsemble
+from ensemble import CAPTURED, DESTROYED
+from models import Butler1993
+import helpers as h
+
+class HopSkipEnsemble(CartesianEnsemble):
+    """
+    Particle ensemble for models with the same hop everywhere
+
+    Positions are unit vectors as in CartesianEnsemble. Particles whose
+    distance to the nearest polar region is at least jump_sigmas times the
+    spread of a jump of m >= min_jump hops take that jump in one step, so the
+    chance of a jump passing through a polar region unnoticed is negligible.
+    Jumps are never longer than the hops a particle has left to survive.
+    A jump is one step, so a max_hops limit on run counts steps, not hops.
+
+    Attributes:
+        delta: Angle between start and final position of every hop
+        lifetime: Array of the hop on which each particle is photodestroyed
+            (infinite without photodestruction)
+        jump_sigmas: Number of jump spreads needed between a particle and the
+            polar regions for it to jump
+        min_jump: Fewest hops replaced by a jump
+        (other attributes as in CartesianEnsemble)
+    """
+    # Names of models this engine can run
+    model_names = (Butler1993.name,)
+
+    def __init__(self, start_option, model_option, num_particles, rng=None,
+                 photoloss_timescale=None, tables=None, jump_sigmas=3,
+                 min_jump=16):
+        """
+        Args:
+            start_option: String specifying method of choosing initial
+                positions
+            model_option: String name of model, or a Butler1993 model object
+            num_particles: Number of particles in ensemble
+            rng: Optional RandomStream or Generator, default global state
+            photoloss_timescale: Timescale for photodestruction (s), default
+                helpers.PHOTOLOSS_TIMESCALE
+            tables: Ignored, as hop conditions are only calculated once
+            jump_sigmas: Number of jump spreads needed between a particle and
+                the polar regions for it to jump, default 3
+            min_jump: Fewest hops replaced by a jump, default 16
+        """
+        super().__init__(start_option, model_option, num_particles, rng,
+                         photoloss_timescale)
+        if not isinstance(self.model, Butler1993):
+            raise ValueError(f"HopSkipEnsemble only runs the "
+                             f"{Butler1993.name} model")
+        self.jump_sigmas = jump_sigmas
+        self.min_jump = min_jump
+        self.delta = float(h.get_delta(self.velocity[0], self.model.angle))
+        self._cos_pole = np.cos(self.model.phi_pole)
+
+        # Jumps need room for min_jump hops between the equator and the
+        # polar regions, otherwise every hop is taken exactly
+        room = np.pi / 2 - self.model.phi_pole
+        self._can_jump = room >= jump_sigmas * self.delta * np.sqrt(min_jump)
+
+        # Number of hops survived is geometric, with the same chance of
+        # photodestruction on every hop
+        survival = np.exp(-self.hop_time[0] / self.photoloss_timescale)
+        self.lifetime = np.full(num_particles, np.inf)
+        if survival < 1:
+            uniform = 1 - self.rng.uniform(0, 1, size=num_particles)
+            self.lifetime = np.floor(np.log(uniform) / np.log(survival)) + 1
+
+    def jump_lengths(self, idx):
+        """
+        Get the number of hops each particle takes in the next step
+
+        Args:
+            idx: Array of indices of particles about to hop
+
+        Return:
+            Array of number of hops, 1 for particles hopping exactly
+        """
+        remaining = self.lifetime[idx] - self.hops[idx]
+        # Angular distance to the edge of the nearest polar region, zero for
+        # particles already inside one so they hop exactly
+        distance = np.maximum(
+            np.arccos(np.abs(self.y[idx])) - self.model.phi_pole, 0)
+        lengths = np.floor(
+            (distance / (self.jump_sigmas * self.delta))**2)
+        lengths = np.minimum(lengths, remaining)
+        return np.where(lengths >= self.min_jump, lengths, 1).astype(np.int64)
+
+    def move(self, idx):
+        """
+        Move particles to their new positions by one hop or one jump
+
+        Args:
+            idx: Array of indices of particles to move
+        """
+        x, y, z = self.x[idx], self.y[idx], self.z[idx]
+
+        # Get random tangent vector as in CartesianEnsemble, whose length is
+        # also the spread of a diffusive jump in units of its deviation
+        tangent = h.tangent_vector(x, y, z,
+                                   self.rng.standard_normal((3, idx.size)))
+
+        lengths = self.jump_lengths(idx) if self._can_jump else None
+        if lengths is None or np.all(lengths == 1):
+            # Every hop has the same arc length
+            delta = self.delta
+            hops = 1
+        else:
+            # After m hops the walk has spread like a 2-D Gaussian with
+            # variance m * delta**2 / 2 along each tangent direction
+            delta = np.where(lengths > 1,
+                             self.delta * np.sqrt(lengths / 2) * tangent[3],
+                             self.delta)
+            hops = lengths
+
+        self.x[idx], self.y[idx], self.z[idx] = \
+            h.rotate_towards(x, y, z, tangent, delta)
+        self.phi[idx] = np.arccos(np.clip(self.y[idx], -1, 1))
+        self.hops[idx] += hops
+
+    def step(self):
+        """
+        Advance every live particle by one hop, or one jump if far from the
+        polar regions
+
+        Return:
+            Integer number of particles still hopping after the step
+        """
+        idx = self.live
+        if idx.size == 0:
+            return 0
+
+        self.move(idx)
+        # Every hop takes the same time
+        self.elapsed[idx] = self.hops[idx] * self.hop_time[idx]
+
+        # Particles are destroyed on the hop their lifetime runs out, before
+        # they can be captured
+        destroyed = self.hops[idx] >= self.lifetime[idx]
+        self.fate[idx[destroyed]] = DESTROYED
+        captured = ~destroyed & (np.abs(self.y[idx]) > self._cos_pole)
+        self.fate[idx[captured]] = CAPTURED
+
+        if self.recorder is not None:
+            self.recorder.record(self, idx)
+
+        # Hop conditions never change, so there is nothing to update
+        self.live = idx[~(destroyed | captured)]
+        return self.live.size
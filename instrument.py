@@ -0,0 +1,231 @@
+"""
+Opt-in timers and counters for the hopping hot path
+
+Instrumentation only wraps methods while it is active (as a context manager),
+so there is no cost at all when it is not used. Since it wraps methods of the
+classes themselves, it only sees particles hopped in the current process.
+
+Example:
+    with Instrumentation() as stats:
+        option_all_runs("random", "1997")
+    print(stats.report())
+"""
+import functools
+import time
+
+import numpy as np
+
+from agent import Particle
+from engines import ENGINES, make_ensemble
+from ensemble import DESTROYED, CAPTURED, HOPPING
+from random_stream import RandomStream
+
+# Methods timed for each particle class
+PHASES = ("move", "is_photodestroy", "is_captured", "update_conditions")
+
+class Instrumentation:
+    """
+    Collects call counts, time per phase and number of hops to each fate
+
+    Attributes:
+        bin_width: Number of hops per bin of hops-to-fate histograms
+        calls: Dictionary of number of calls of each phase
+        items: Dictionary of number of particles processed by each phase
+        times: Dictionary of cumulative time (s) spent in each phase
+        hops: Dictionary of array of number of particles by number of hops
+            taken before each fate (bin i is i hops)
+        truncated: Number of particles still hopping when a run hit its hop
+            limit
+    """
+    def __init__(self, bin_width=10):
+        self.bin_width = bin_width
+        self.calls = {}
+        self.items = {}
+        self.times = {}
+        self.hops = {"destroyed": np.zeros(0, dtype=np.int64),
+                     "captured": np.zeros(0, dtype=np.int64)}
+        self.truncated = 0
+        self._originals = []
+
+    def __enter__(self):
+        # Wrap phases of every particle class, where they are defined
+        for cls in (Particle, *ENGINES.values()):
+            for phase in PHASES:
+                if phase in vars(cls):
+                    self._patch(cls, phase, self._timed)
+        for cls in ENGINES.values():
+            if "run" in vars(cls):
+                self._patch(cls, "run", self._fated)
+        self._patch(Particle, "truncate", self._truncated)
+        return self
+
+    def __exit__(self, *exc):
+        # Restore original methods
+        for cls, name, method in reversed(self._originals):
+            setattr(cls, name, method)
+        self._originals = []
+
+    def _patch(self, cls, name, wrap):
+        """
+        Replace a method of a class with a wrapped version
+
+        Args:
+            cls: Class to patch
+            name: String name of method
+            wrap: Function taking a method and returning a wrapper
+        """
+        method = vars(cls)[name]
+        self._originals.append((cls, name, method))
+        setattr(cls, name, wrap(method))
+
+    def _timed(self, method):
+        """
+        Wrap a phase method to count calls and time spent
+        """
+        @functools.wraps(method)
+        def wrapper(obj, *args):
+            start = time.perf_counter()
+            result = method(obj, *args)
+            # Label by class of particle, since phases can be inherited
+            label = f"{type(obj).__name__}.{method.__name__}"
+            self.times[label] = self.times.get(label, 0.0) + \
+                time.perf_counter() - start
+            self.calls[label] = self.calls.get(label, 0) + 1
+            # Batched methods take an array of indices as first argument
+            size = args[0].size if args else 1
+            self.items[label] = self.items.get(label, 0) + size
+
+            # Track hops of single particles, since Particle does not
+            if isinstance(obj, Particle):
+                if method.__name__ == "move":
+                    obj.hops = getattr(obj, "hops", 0) + 1
+                elif method.__name__ != "update_conditions" and result:
+                    fate = "destroyed" if method.__name__ == \
+                        "is_photodestroy" else "captured"
+                    self.add_hops(fate, [getattr(obj, "hops", 0)])
+            return result
+        return wrapper
+
+    def _fated(self, method):
+        """
+        Wrap an ensemble run method to record hops taken before each fate
+        """
+        @functools.wraps(method)
+        def wrapper(obj, *args, **kwargs):
+            start = time.perf_counter()
+            result = method(obj, *args, **kwargs)
+            label = f"{type(obj).__name__}.{method.__name__}"
+            self.times[label] = self.times.get(label, 0.0) + \
+                time.perf_counter() - start
+            self.calls[label] = self.calls.get(label, 0) + 1
+            self.items[label] = self.items.get(label, 0) + len(obj)
+            self.add_hops("destroyed", obj.hops[obj.fate == DESTROYED])
+            self.add_hops("captured", obj.hops[obj.fate == CAPTURED])
+            self.truncated += int(np.count_nonzero(obj.fate == HOPPING))
+            return result
+        return wrapper
+
+    def _truncated(self, method):
+        """
+        Wrap Particle.truncate to count single particles stopped by a hop
+        limit
+        """
+        @functools.wraps(method)
+        def wrapper(obj):
+            method(obj)
+            self.truncated += 1
+        return wrapper
+
+    def add_hops(self, fate, hops):
+        """
+        Add particles to the hops-to-fate histogram
+
+        Args:
+            fate: String, either "destroyed" or "captured"
+            hops: Array of number of hops each particle took
+        """
+        counts = np.bincount(np.asarray(hops, dtype=np.int64))
+        total = self.hops[fate]
+        if counts.size > total.size:
+            total = np.pad(total, (0, counts.size - total.size))
+        total[:counts.size] += counts
+        self.hops[fate] = total
+
+    def report(self):
+        """
+        Summarize everything collected so far
+
+        Return:
+            Dictionary of phases (calls, particles, time and time per particle
+            for each), hops-to-fate histograms with bins of bin_width hops,
+            mean hops to each fate, and number of truncated particles
+        """
+        phases = {}
+        for label in sorted(self.calls):
+            phases[label] = {
+                "calls": self.calls[label],
+                "particles": self.items[label],
+                "time": self.times[label],
+                "time_per_particle": self.times[label] /
+                                     max(self.items[label], 1),
+            }
+
+        histograms = {}
+        mean_hops = {}
+        for fate, counts in self.hops.items():
+            # Combine bins of single hops into bins of bin_width hops
+            n_bins = -(-counts.size // self.bin_width)
+            padded = np.pad(counts, (0, n_bins * self.bin_width - counts.size))
+            histograms[fate] = padded.reshape(-1, self.bin_width) \
+                .sum(axis=1).tolist()
+            total = counts.sum()
+            mean_hops[fate] = float(np.arange(counts.size) @ counts / total) \
+                if total else None
+
+        return {
+            "phases": phases,
+            "bin_width": self.bin_width,
+            "hops_to_fate": histograms,
+            "mean_hops": mean_hops,
+            "truncated": self.truncated,
+        }
+
+def compare_engines(engines=("spherical", "jit"), start_option="random",
+                    model_option="1997", num_particles=10000, seed=None,
+                    max_hops=None):
+    """
+    Run the same ensemble with several engines under instrumentation, to
+    check each run is counted once whichever way an engine hops
+
+    Engines that hop with ParticleEnsemble.step (such as jit without numba)
+    give identical totals for the same seed. Others should agree within
+    sampling error.
+
+    Args:
+        engines: Iterable of string names of engines in ENGINES
+        start_option: String specifying method of choosing initial positions
+        model_option: String for model - either Butler's 1993 or 1997 paper
+        num_particles: Number of particles in each ensemble
+        seed: Integer seed, the same for every engine, default None
+        max_hops: Optional integer limit on the number of hops
+
+    Return:
+        Dictionary by engine of dictionaries of particles destroyed, captured
+        and truncated as counted by the ensemble, and as counted by
+        instrumentation
+    """
+    results = {}
+    for engine in engines:
+        ensemble = make_ensemble(engine, start_option, model_option,
+                                 num_particles, RandomStream(seed))
+        with Instrumentation() as stats:
+            ensemble.run(max_hops)
+        results[engine] = {
+            "destroyed": ensemble.n_destroyed,
+            "captured": ensemble.n_captured,
+            "truncated": ensemble.n_hopping,
+            "instrumented_destroyed": int(stats.hops["destroyed"].sum()),
+            "instrumented_captured": int(stats.hops["captured"].sum()),
+            "instrumented_truncated": stats.truncated,
+        }
+    return results
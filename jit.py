@@ -0,0 +1,239 @@
+"""
+Contains the JitEnsemble, which runs each particle's whole life in one
+compiled loop when numba is installed
+
+The NumPy engines make temporary arrays for every phase of every hop. With
+numba, the move, photodestruction test, capture test and update of hop
+conditions are fused into one loop per particle with no temporaries, compiled
+once and cached on disk so later runs start quickly. Without numba the engine
+falls back to the NumPy steps of ParticleEnsemble.
+
+Seed contract: the compiled loop draws from the numpy Generator behind the
+ensemble's RandomStream, particle by particle in index order, in the same
+order as Particle (direction, photodestruction, capture, launch angle). A
+fixed seed therefore gives identical results every time, which match the
+reference engines statistically but not draw for draw.
+
+Example:
+    ensemble = JitEnsemble("random", "1997", 100000, RandomStream(1))
+    n_destroyed, n_captured = ensemble.run()
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from ensemble import ParticleEnsemble, DESTROYED, CAPTURED
+from models import Butler1993, Butler1997
+from random_stream import RandomStream
+import helpers as h
+
+# Kinds of model the compiled loop knows, given by the model's class
+MODEL_1993 = 0
+MODEL_1997 = 1
+
+# Constants as module globals, which numba compiles in
+G_MOON = h.G_MOON
+R_MOON = h.R_MOON
+BOLTZMANN = h.BOLTZMANN
+
+def _run_lives(live, phi, beta, fate, hops, temp, velocity, launch_angle,
+               hop_time, elapsed, generator, kind, params, capture_edges,
+               capture_table, mass, photoloss_timescale, max_hops):
+    """
+    Hop each live particle until it is removed or reaches max_hops
+
+    Written so numba can compile it, but runs (slowly) as plain Python too.
+    Arrays of particle state are updated in place.
+
+    Args:
+        live: Array of indices of particles to hop
+        phi, beta, fate, hops, temp, velocity, launch_angle, hop_time,
+            elapsed: Arrays of particle state as in ParticleEnsemble
+        generator: numpy Generator to draw random numbers from
+        kind: MODEL_1993 or MODEL_1997
+        params: Array of model parameters, (t_surface, angle, phi_pole) for
+            MODEL_1993 or (t_0, t_1, n) for MODEL_1997
+        capture_edges, capture_table: Capture bins of MODEL_1997
+        mass: Mass of molecule in kg
+        photoloss_timescale: Timescale for photodestruction (s)
+        max_hops: Maximum number of hops per particle, negative for no limit
+
+    Return:
+        Array of indices of particles still hopping
+    """
+    remaining = np.empty(live.size, dtype=np.int64)
+    n_remaining = 0
+    for i in live:
+        p = phi[i]
+        b = beta[i]
+        v = velocity[i]
+        angle = launch_angle[i]
+        t = hop_time[i]
+        count = 0
+        hopping = True
+        while max_hops < 0 or count < max_hops:
+            # Move by one hop in a random direction
+            delta = v * np.cos(angle) * t / R_MOON
+            psi = generator.uniform(0, 2 * np.pi)
+            p_old = p
+            cos_phi = np.cos(p_old) * np.cos(delta) + \
+                np.sin(p_old) * np.sin(delta) * np.cos(psi)
+            p = np.arccos(min(max(cos_phi, -1.0), 1.0))
+            cos_epsilon = (np.cos(delta) - np.cos(p) * np.cos(p_old)) / \
+                (np.sin(p) * np.sin(p_old))
+            epsilon = np.arccos(min(max(cos_epsilon, -1.0), 1.0))
+            b = b + epsilon if psi > np.pi else b - epsilon
+            if b < 0:
+                b += 2 * np.pi
+            elif b > 2 * np.pi:
+                b -= 2 * np.pi
+            count += 1
+            elapsed[i] += t
+
+            # Check for photodestruction
+            prob = 1 - np.exp(-t / photoloss_timescale)
+            if generator.uniform(0, 1) < prob:
+                fate[i] = DESTROYED
+                hopping = False
+                break
+
+            # Check for capture, then update conditions for the next hop
+            if kind == MODEL_1993:
+                if min(p, np.pi - p) < params[2]:
+                    fate[i] = CAPTURED
+                    hopping = False
+                    break
+                temp[i] = params[0]
+                angle = params[1]
+            else:
+                latitude = abs(np.rad2deg(p) - 90)
+                prob = capture_table[np.searchsorted(capture_edges, latitude)]
+                if generator.uniform(0, 1) < prob:
+                    fate[i] = CAPTURED
+                    hopping = False
+                    break
+                temp[i] = params[0] + params[1] * np.cos(p - np.pi / 2) ** \
+                    params[2]
+                angle = np.arccos(generator.uniform(0, 1))
+            v = np.sqrt(3 * BOLTZMANN * temp[i] / mass)
+            t = 2 * v * np.sin(angle) / G_MOON
+
+        phi[i] = p
+        beta[i] = b
+        velocity[i] = v
+        launch_angle[i] = angle
+        hop_time[i] = t
+        hops[i] += count
+        if hopping:
+            remaining[n_remaining] = i
+            n_remaining += 1
+    return remaining[:n_remaining]
+
+@lru_cache(maxsize=None)
+def compiled_run_lives():
+    """
+    Get _run_lives compiled by numba, or None if numba is not installed
+
+    Numba is optional and slow to import, so it is only imported the first
+    time a JitEnsemble needs it rather than by every process that imports
+    this module. Compiled code is cached next to this file.
+    """
+    try:
+        import numba
+    except ImportError:
+        return None
+    return numba.njit(cache=True)(_run_lives)
+
+def stream_kind():
+    """
+    Get which random numbers the jit engine draws in this process: "compiled"
+    with numba or "numpy" without, which give different results for a seed
+
+    Return:
+        String kind of stream
+    """
+    return "numpy" if compiled_run_lives() is None else "compiled"
+
+class JitEnsemble(ParticleEnsemble):
+    """
+    Particle ensemble whose run hops each particle to its fate in one
+    compiled loop
+
+    Only the built-in 1993 and 1997 models are compiled, and the compiled
+    loop calculates hop conditions exactly rather than from tables. step is
+    the NumPy step of ParticleEnsemble, and run also uses it when numba is
+    missing, a recorder is watching or the random numbers come from numpy's
+    global state.
+
+    Attributes:
+        (as in ParticleEnsemble)
+    """
+    # Names of models this engine can run
+    model_names = (Butler1993.name, Butler1997.name)
+
+    def __init__(self, start_option, model_option, num_particles, rng=None,
+                 photoloss_timescale=None, tables=None):
+        super().__init__(start_option, model_option, num_particles, rng,
+                         photoloss_timescale, tables)
+        if not isinstance(self.model, (Butler1993, Butler1997)):
+            raise ValueError("JitEnsemble only runs the models in "
+                             "models.MODELS")
+
+    @property
+    def compiled(self):
+        """
+        Whether run uses the compiled loop
+        """
+        return self.recorder is None and self._generator() is not None \
+            and compiled_run_lives() is not None
+
+    def _generator(self):
+        """
+        Get the numpy Generator behind rng, or None for the global state
+        """
+        if isinstance(self.rng, RandomStream):
+            return self.rng.generator
+        if isinstance(self.rng, np.random.Generator):
+            return self.rng
+        return None
+
+    def _model_arguments(self):
+        """
+        Get the kind, parameters and capture bins of the model
+        """
+        model = self.model
+        if isinstance(model, Butler1993):
+            return (MODEL_1993,
+                    np.array([model.t_surface, model.angle, model.phi_pole],
+                             dtype=float),
+                    np.zeros(0), np.zeros(1))
+        return (MODEL_1997, np.array([model.t_0, model.t_1, model.n],
+                                     dtype=float),
+                model.capture_edges, model.capture_table.astype(float))
+
+    def run(self, max_hops=None):
+        """
+        Hop all particles until every one is removed
+
+        Args:
+            max_hops: Optional integer safety limit on the number of hops,
+                default None for no limit. Particles still hopping at the
+                limit are left HOPPING and counted by n_hopping.
+
+        Return:
+            Tuple of number of particles destroyed and captured
+        """
+        if not self.compiled:
+            # Loop here rather than calling ParticleEnsemble.run, so wrappers
+            # of run (e.g. from instrument.py) see one run, not two
+            for _ in h.hop_counter(max_hops):
+                if self.step() == 0:
+                    break
+            return self.n_destroyed, self.n_captured
+        self.live = compiled_run_lives()(
+            self.live, self.phi, self.beta, self.fate, self.hops, self.temp,
+            self.velocity, self.launch_angle, self.hop_time, self.elapsed,
+            self._generator(), *self._model_arguments(), float(self.mass),
+            float(self.photoloss_timescale),
+            -1 if max_hops is None else max_hops)
+        return self.n_destroyed, self.n_captured
@@ -63,7 +63,8 @@ def choose_run(start_option, model_option):
 
     Either plotting journey of one particle, plotting final positions of run of
     one simulation (default hundred particles), or average proportion of
-    particles captured in many runs of simulation (default fifty runs)
+    particles captured in many runs of simulation (default fifty runs), which
+    can be cached between sessions
 
     Args:
         start_option: String specifying method of choosing initial positions
@@ -74,6 +75,7 @@ def choose_run(start_option, model_option):
     print("A) Plot of journey of one particle")
     print("B) Final destinations of multiple particles in model")
     print("C) Average of 50 runs of simulation")
+    print("D) Average of 50 seeded runs, reusing earlier results")
     # Ask for user input
     run_type = input("Enter your model type option (just the letter): ")
 
@@ -84,6 +86,8 @@ def choose_run(start_option, model_option):
         options.option_one_run(start_option, model_option)
     elif run_type == "C":
         options.option_all_runs(start_option, model_option)
+    elif run_type == "D":
+        options.option_cached_runs(start_option, model_option)
     else:
         # Print error if invalid input and try again by recursively calling
         print("ERROR: Please enter a valid option!")
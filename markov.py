@@ -0,0 +1,209 @@
+"""
+Absorbing Markov chain solver for the probability of capture
+
+Temperature, hop velocity and capture in both models depend only on the
+polar coordinate phi, so the hopping process is a Markov chain on phi with
+two absorbing states (photodestroyed and captured). Discretizing phi into
+bins and building the one-hop transition kernel from the same helpers used by
+the Monte Carlo engine gives the capture probability from every starting
+latitude with a single linear solve.
+"""
+import numpy as np
+
+from ensemble import ParticleEnsemble
+from models import get_model
+from random_stream import RandomStream
+import helpers as h
+
+class CaptureSolver:
+    """
+    Capture probability as a function of starting phi for one model
+
+    Attributes:
+        model_option: String name of model
+        model: Model object from models.py giving temperature, launch angles
+            and capture
+        photoloss_timescale: Timescale for loss by photodestruction (s)
+        edges: Array of phi bin edges (in radians)
+        centers: Array of phi bin centers (in radians)
+        transition: (n_bins, n_bins) matrix of probability of surviving a hop
+            from bin i without capture and landing in bin j
+        p_captured: Array of probability of being captured on the next hop
+        p_destroyed: Array of probability of photodestruction on the next hop
+        capture: Array of total probability of eventual capture from each bin
+    """
+    def __init__(self, model_option, n_bins=360, n_angles=32, n_directions=32,
+                 n_sub=2, photoloss_timescale=None):
+        """
+        Build the hop kernel and solve for the capture probability
+
+        Args:
+            model_option: String name of model in models.MODELS, or a model
+                object
+            n_bins: Number of bins in phi between 0 and pi
+            n_angles: Number of launch angles in quadrature (if random)
+            n_directions: Number of hop directions psi in quadrature
+            n_sub: Number of starting points within each bin
+            photoloss_timescale: Timescale for photodestruction (s), default
+                helpers.PHOTOLOSS_TIMESCALE
+        """
+        self.model = get_model(model_option)
+        self.model_option = self.model.name
+        self.photoloss_timescale = h.PHOTOLOSS_TIMESCALE \
+            if photoloss_timescale is None else photoloss_timescale
+        self.edges = np.linspace(0, np.pi, n_bins + 1)
+        self.centers = (self.edges[:-1] + self.edges[1:]) / 2
+
+        self.build_kernel(n_angles, n_directions, n_sub)
+        self.capture = self.solve()
+
+    def build_kernel(self, n_angles, n_directions, n_sub):
+        """
+        Build transition and absorption probabilities for a single hop
+
+        Integrates over starting points within each bin, launch angles and hop
+        directions with midpoint quadrature.
+
+        Args:
+            n_angles: Number of launch angles in quadrature (if random)
+            n_directions: Number of hop directions psi in quadrature
+            n_sub: Number of starting points within each bin
+        """
+        n_bins = self.centers.size
+        width = self.edges[1] - self.edges[0]
+
+        # Starting points within each bin, shape (n_bins, n_sub)
+        frac = (np.arange(n_sub) + 0.5) / n_sub
+        phi = self.edges[:-1, None] + width * frac[None, :]
+
+        # Launch angles, equally weighted
+        angles = self.model.angle_quadrature(n_angles)
+
+        # New phi only depends on cos(psi), so psi between 0 and pi is enough
+        psi = np.pi * (np.arange(n_directions) + 0.5) / n_directions
+
+        # Hop conditions for every start point and launch angle
+        phi = phi[:, :, None, None]
+        angles = angles[None, None, :, None]
+        velocity = h.velocity_rms(h.MASS_WATER, self.model.temperature(phi))
+        hop_time = h.time_per_hop(velocity, angles)
+        delta = h.get_delta(velocity, angles)
+
+        # Landing positions, using same update as Particle.update_phi
+        expression = (np.cos(phi) * np.cos(delta)) + \
+                        (np.sin(phi) * np.sin(delta) * np.cos(psi))
+        phi_new = np.arccos(np.clip(expression, -1, 1))
+
+        # Weight of each quadrature point, then split into outcomes
+        weight = 1 / (n_sub * angles.size * n_directions)
+        survive = np.exp(-hop_time / self.photoloss_timescale)
+        prob_capture = self.model.capture_probability(phi_new)
+        captured = weight * survive * prob_capture
+        hopping = weight * survive * (1 - prob_capture)
+        shape = (n_bins, n_sub, angles.size, n_directions)
+
+        self.p_destroyed = np.broadcast_to(weight * (1 - survive), shape) \
+            .reshape(n_bins, -1).sum(axis=1)
+        self.p_captured = captured.reshape(n_bins, -1).sum(axis=1)
+
+        # Accumulate probability of landing in each bin for remaining hops
+        rows = np.broadcast_to(np.arange(n_bins)[:, None, None, None], shape)
+        cols = np.clip(np.searchsorted(self.edges, phi_new, side="right") - 1,
+                       0, n_bins - 1)
+        flat = rows.ravel() * n_bins + np.broadcast_to(cols, shape).ravel()
+        self.transition = np.bincount(
+            flat, weights=np.broadcast_to(hopping, shape).ravel(),
+            minlength=n_bins * n_bins).reshape(n_bins, n_bins)
+
+    def solve(self):
+        """
+        Solve for the probability of eventual capture from each bin
+
+        Solves (I - P) x = a, where P is the transition matrix and a the
+        probability of capture on the next hop.
+
+        Return:
+            Array of probability of capture from each bin
+        """
+        n_bins = self.centers.size
+
+        # Sparse solver is optional, fall back to a dense solve without scipy
+        try:
+            from scipy import sparse
+            from scipy.sparse.linalg import spsolve
+        except ImportError:
+            return np.linalg.solve(np.eye(n_bins) - self.transition,
+                                   self.p_captured)
+        matrix = sparse.identity(n_bins, format="csr") - \
+            sparse.csr_matrix(self.transition)
+        return spsolve(matrix.tocsc(), self.p_captured)
+
+    def capture_fraction(self, phi):
+        """
+        Get probability of capture for particles starting at given phi
+
+        Args:
+            phi: Float or array of polar spherical coordinates (in radians)
+
+        Return:
+            Float or array of probability of capture
+        """
+        return np.interp(phi, self.centers, self.capture)
+
+    def capture_fraction_latitude(self, latitude):
+        """
+        Get probability of capture for particles starting at given latitude
+
+        Args:
+            latitude: Float or array of latitude in degrees, negative for south
+
+        Return:
+            Float or array of probability of capture
+        """
+        return self.capture_fraction(h.latitude_to_phi(latitude))
+
+    def capture_fraction_random(self):
+        """
+        Get probability of capture for particles starting at random positions
+
+        Random positions are uniform on the sphere, so each bin is weighted by
+        its area.
+
+        Return:
+            Float probability of capture
+        """
+        area = np.diff(-np.cos(self.edges))
+        return float(np.sum(area * self.capture) / np.sum(area))
+
+def compare_monte_carlo(solver, phi, num_particles=10000, seed=None,
+                        max_hops=None):
+    """
+    Compare capture probability from solver against Monte Carlo simulation
+
+    Args:
+        solver: CaptureSolver to compare
+        phi: Float polar spherical coordinate to start all particles at
+        num_particles: Number of particles in Monte Carlo simulation
+        seed: Integer seed for Monte Carlo simulation, default None
+        max_hops: Optional safety limit on hops per particle in simulation
+
+    Return:
+        Dictionary of both estimates, standard error of Monte Carlo estimate
+        and number of standard errors between them
+    """
+    rng = RandomStream(seed)
+    ensemble = ParticleEnsemble("seventy_deg_south", solver.model,
+                                num_particles, rng, solver.photoloss_timescale)
+    ensemble.set_positions(phi, 0)
+    n_destroyed, n_captured = ensemble.run(max_hops)
+
+    markov = float(solver.capture_fraction(phi))
+    monte_carlo = n_captured / (n_destroyed + n_captured)
+    std_err = np.sqrt(monte_carlo * (1 - monte_carlo) /
+                      (n_destroyed + n_captured))
+    return {
+        "markov": markov,
+        "monte_carlo": monte_carlo,
+        "std_err": float(std_err),
+        "z_score": float((monte_carlo - markov) / std_err) if std_err else 0.0,
+    }
@@ -0,0 +1,246 @@
+"""
+Physics models of the lunar surface that particles hop across
+
+A model gives the surface temperature, launch angles and probability of
+capture, all as functions of the polar coordinate phi that work on arrays.
+Models whose temperature also depends on local time set local_time, and are
+given the azimuthal coordinate beta and time of flight as well.
+Particles and ensembles look their model up once when they are created, so
+the hopping loop never has to check which model it is running.
+
+New models only need the same methods and attributes as Butler1993 and
+Butler1997, and can be added to MODELS to be chosen by name.
+"""
+import numpy as np
+
+from thermal import default_table
+import helpers as h
+
+class Butler1993:
+    """
+    Simple model of Butler's 1993 paper
+
+    Constant surface temperature, fixed launch angle, and certain capture in
+    polar regions of fixed radius around either pole.
+
+    Attributes:
+        t_surface: Temperature of the whole surface (K)
+        angle: Launch angle of every hop (radians)
+        phi_pole: Angular radius of polar regions (radians)
+    """
+    name = "1993"
+    local_time = False
+
+    def __init__(self, t_surface=h.T_SURFACE, angle=h.ANGLE, r_pole=h.R_POLE):
+        """
+        Args:
+            t_surface: Temperature of the whole surface (K)
+            angle: Launch angle of every hop (radians)
+            r_pole: Radius of polar regions (m)
+        """
+        self.t_surface = t_surface
+        self.angle = angle
+        self.phi_pole = r_pole / h.R_MOON
+
+    def temperature(self, phi):
+        """
+        Get surface temperature (K) at polar coordinates phi
+        """
+        return np.full(np.shape(phi), self.t_surface, dtype=float)
+
+    def launch_angle(self, size=None, rng=None):
+        """
+        Get launch angles (radians), a float if size is None
+        """
+        return self.angle if size is None else np.full(size, self.angle)
+
+    def angle_quadrature(self, n_angles):
+        """
+        Get equally weighted launch angles that represent their distribution
+        """
+        return np.array([self.angle])
+
+    def capture_probability(self, phi):
+        """
+        Get probability of capture (0 or 1) of particles landing at phi
+        """
+        return self.in_polar_region(phi).astype(float)
+
+    def in_polar_region(self, phi):
+        """
+        Check whether polar coordinates phi lie within a polar region
+        """
+        return np.minimum(phi, np.pi - phi) < self.phi_pole
+
+    def is_captured(self, phi, rng=None):
+        """
+        Check whether particles landing at phi are captured
+
+        Capture in polar regions is certain, so no random numbers are drawn.
+        """
+        return self.in_polar_region(phi)
+
+class Butler1997:
+    """
+    Model of Butler's 1997 paper
+
+    Surface temperature varies with latitude, launch angles follow a cosine
+    distribution and probability of capture is binned by latitude.
+
+    Attributes:
+        t_0, t_1, n: Parameters of surface temperature t_0 + t_1 cos^n(lat)
+        capture_edges: Array of latitudes (degrees from equator) at which
+            probability of capture changes, in increasing order
+        capture_table: Array of probability of capture between each edge,
+            one longer than capture_edges
+    """
+    name = "1997"
+    local_time = False
+
+    def __init__(self, t_0=h.T_0, t_1=h.T_1, n=h.N,
+                 capture_bins=h.CAPTURE_BINS):
+        """
+        Args:
+            t_0, t_1, n: Parameters of surface temperature t_0 + t_1 cos^n(lat)
+            capture_bins: Sequence of (latitude, percentage) pairs, giving
+                the percentage captured beyond each latitude (degrees from
+                equator)
+        """
+        self.t_0 = t_0
+        self.t_1 = t_1
+        self.n = n
+        bins = sorted(capture_bins)
+        self.capture_edges = np.array([lim for lim, _ in bins], dtype=float)
+        self.capture_table = np.array([0] + [perc / 100 for _, perc in bins])
+
+    def temperature(self, phi):
+        """
+        Get surface temperature (K) at polar coordinates phi
+        """
+        return self.t_0 + self.t_1 * np.power(np.cos(phi - np.pi/2), self.n)
+
+    def launch_angle(self, size=None, rng=None):
+        """
+        Get random launch angles (radians), a float if size is None
+        """
+        return np.arccos(h.get_rng(rng).uniform(0, 1, size))
+
+    def angle_quadrature(self, n_angles):
+        """
+        Get equally weighted launch angles that represent their distribution
+        """
+        return np.arccos((np.arange(n_angles) + 0.5) / n_angles)
+
+    def capture_probability(self, phi):
+        """
+        Get probability of capture of particles landing at phi
+        """
+        # Degrees from equator, then look up its bin
+        angle = np.abs(np.rad2deg(phi) - 90)
+        return self.capture_table[np.searchsorted(self.capture_edges, angle)]
+
+    def is_captured(self, phi, rng=None):
+        """
+        Check whether particles landing at phi are captured
+        """
+        size = np.size(phi) if np.ndim(phi) else None
+        return h.get_rng(rng).uniform(0, 1, size) < \
+            self.capture_probability(phi)
+
+class LocalTime1997:
+    """
+    Model of Butler's 1997 paper with a day and night side
+
+    Surface temperature is looked up in a ThermalTable by phi and local
+    solar time, which depends on beta and on how far the moon has turned
+    since particles were released. Launch angles and capture are those of
+    Butler1997.
+
+    Attributes:
+        table: ThermalTable of temperature by phi and hour angle
+        subsolar_beta: Azimuthal coordinate of the subsolar point when
+            particles are released (radians)
+        period: Time for the moon to turn once relative to the sun (s)
+        surface: Butler1997 model giving launch angles and capture
+    """
+    name = "local_time"
+    local_time = True
+
+    def __init__(self, table=None, subsolar_beta=0.0, period=h.SYNODIC_MONTH,
+                 capture_bins=h.CAPTURE_BINS):
+        """
+        Args:
+            table: ThermalTable of temperature by phi and hour angle, default
+                thermal.analytic_temperature tabulated
+            subsolar_beta: Azimuthal coordinate of the subsolar point when
+                particles are released (radians), default 0
+            period: Time for the moon to turn once relative to the sun (s),
+                default helpers.SYNODIC_MONTH
+            capture_bins: Sequence of (latitude, percentage) pairs as in
+                Butler1997
+        """
+        self.table = default_table() if table is None else table
+        self.subsolar_beta = subsolar_beta
+        self.period = period
+        self.surface = Butler1997(capture_bins=capture_bins)
+
+    def temperature(self, phi, beta=None, time=None):
+        """
+        Get surface temperature (K) at polar coordinates phi and azimuthal
+        coordinates beta, after a time of flight (s)
+
+        Without beta, the temperature averaged over local time is given
+        instead, e.g. for solvers that only follow latitude.
+        """
+        if beta is None:
+            return self.table.zonal_mean(phi)
+        hour_angle = beta - self.subsolar_beta
+        if time is not None:
+            # The subsolar point moves west as the moon turns
+            hour_angle = hour_angle + 2 * np.pi / self.period * time
+        return self.table(phi, hour_angle)
+
+    def launch_angle(self, size=None, rng=None):
+        """
+        Get random launch angles (radians), a float if size is None
+        """
+        return self.surface.launch_angle(size, rng)
+
+    def angle_quadrature(self, n_angles):
+        """
+        Get equally weighted launch angles that represent their distribution
+        """
+        return self.surface.angle_quadrature(n_angles)
+
+    def capture_probability(self, phi):
+        """
+        Get probability of capture of particles landing at phi
+        """
+        return self.surface.capture_probability(phi)
+
+    def is_captured(self, phi, rng=None):
+        """
+        Check whether particles landing at phi are captured
+        """
+        return self.surface.is_captured(phi, rng)
+
+# Models by name, as chosen by model_option
+MODELS = {
+    Butler1993.name: Butler1993,
+    Butler1997.name: Butler1997,
+    LocalTime1997.name: LocalTime1997,
+}
+
+def get_model(model_option):
+    """
+    Get the model to use for a model option
+
+    Args:
+        model_option: String name of model in MODELS, or a model object
+
+    Return:
+        Model object
+    """
+    if isinstance(model_option, str):
+        return MODELS[model_option]()
+    return model_option
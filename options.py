@@ -1,14 +1,17 @@
 """
 Running and plotting options for simulation
-"""
-import matplotlib.pyplot as plt
-# Extra library! All it does is create a progress bar in the terminal
-from tqdm import tqdm
 
+Matplotlib (through plotting.py) and tqdm are only imported inside the options
+that plot or show progress, so importing this module stays fast.
+"""
 from agent import Particle
 import helpers as h
+from ensemble import ParticleEnsemble, HOPPING, DESTROYED, CAPTURED
+from accumulators import DepositionMap
+from parallel import parallel_runs, parallel_tally
+from cache import ResultCache
 
-def plot_option_journey(ax, start_option, model_option):
+def plot_option_journey(ax, start_option, model_option, max_hops = None):
     """
     Plots the journey of a single particle hopping until it is removed
 
@@ -17,35 +20,46 @@ def plot_option_journey(ax, start_option, model_option):
         phi: Polar spherical coordinate as a float (in radians)
         beta: Azimuthal spherical coordinate as a float (in radians)
         model_option: String for model - either Butler's 1993 or 1997 paper
+        max_hops: Optional safety limit on number of hops, default None
     """
+    import plotting as p
+
     # Declare instance of a hopping particle
     particle = Particle(start_option, model_option)
+    phi = [particle.phi]
+    beta = [particle.beta]
+    fate = HOPPING
 
-    # In arbitrary large range, move and plot particles
-    for i in range(1000):
-        # Plot particle, label with iteration number
-        h.plot_points(ax, particle.phi, particle.beta)
-        ax.text(*h.coord_converter(particle.phi, particle.beta), i, fontsize = 6)
-
+    # Move particle and record positions until it is removed
+    for i in h.hop_counter(max_hops):
         # Move particle
         particle.move()
+        phi.append(particle.phi)
+        beta.append(particle.beta)
 
-        # Check for photodestruction and plot
+        # Check for photodestruction
         if particle.is_photodestroy():
             print(f"Destroyed after {i} hops")
-            h.plot_points(ax, particle.phi, particle.beta, color='g')
+            fate = DESTROYED
             break
 
-        # Check for capture and plot
+        # Check for capture
         if particle.is_captured():
             print(f"Captured after {i} hops")
-            h.plot_points(ax, particle.phi, particle.beta, color='b')
+            fate = CAPTURED
             break
 
         # Update particle hop conditions appropriately
         particle.update_conditions()
+    else:
+        particle.truncate()
+        print(f"Still hopping after hop limit of {max_hops} hops")
 
-def plot_option_one_run(ax, start_option, model_option, num_particles = 100):
+    # Plot whole journey at once
+    p.plot_journey(ax, phi, beta, fate)
+
+def plot_option_one_run(ax, start_option, model_option, num_particles = 100,
+                        max_points = None):
     """
     Plot one run of the entire simulation with (default hundred) particles
 
@@ -55,34 +69,17 @@ def plot_option_one_run(ax, start_option, model_option, num_particles = 100):
         beta: Azimuthal spherical coordinate as a float (in radians)
         model_option: String for model - either Butler's 1993 or 1997 paper
         num_particles: Number of particles to run in simulation, default 100
+        max_points: Maximum number of final positions to plot, default all
     """
-    # Track number of destroyed and captured particles
-    n_destroyed = 0
-    n_captured = 0
-
-    # Run entire hopping journey for each particle
-    for _ in range(num_particles):
-        # Declare instance of a particle
-        particle = Particle(start_option, model_option)
-
-        # In arbitrary large range, move particles
-        for _ in range(1000):
-            particle.move()
+    import plotting as p
 
-            # Check for photodestruction and plot
-            if particle.is_photodestroy():
-                n_destroyed += 1
-                h.plot_points(ax, particle.phi, particle.beta, color='g')
-                break
+    # Run entire hopping journey for all particles at once
+    ensemble = ParticleEnsemble(start_option, model_option, num_particles)
+    n_destroyed, n_captured = ensemble.run()
 
-            # Check for capture and plot
-            if particle.is_captured():
-                n_captured += 1
-                h.plot_points(ax, particle.phi, particle.beta, color='b')
-                break
-
-            # Update particle conditions for next hop
-            particle.update_conditions()
+    # Plot final positions of all particles, one scatter per fate
+    p.plot_final_positions(ax, ensemble.phi, ensemble.beta, ensemble.fate,
+                           max_points)
 
     # Print total number of photodestroyed and captured particles
     print(f"Photodestroyed: {n_destroyed}, Captured: {n_captured}")
@@ -96,17 +93,19 @@ def option_journey(start_option, model_option):
         beta: Azimuthal spherical coordinate as a float (in radians)
         model_option: String for model - either Butler's 1993 or 1997 paper
     """
+    import plotting as p
+
     # Create figure
-    fig = plt.figure(figsize=(8, 8))
-    ax = fig.add_subplot(111, projection='3d')
+    ax = p.create_axes()
 
     # Plot sphere, points
-    h.plot_sphere(ax)
+    p.plot_sphere(ax)
     plot_option_journey(ax, start_option, model_option)
-    h.plot_finish(ax, "Journey of single molecule")
+    p.plot_finish(ax, "Journey of single molecule")
 
 
-def option_one_run(start_option, model_option):
+def option_one_run(start_option, model_option, num_particles = 100,
+                   max_points = None):
     """
     Consolidate all plotting for final state of one run of the simulation
 
@@ -114,15 +113,19 @@ def option_one_run(start_option, model_option):
         phi: Polar spherical coordinate as a float (in radians)
         beta: Azimuthal spherical coordinate as a float (in radians)
         model_option: String for model - either Butler's 1993 or 1997 paper
+        num_particles: Number of particles to run in simulation, default 100
+        max_points: Maximum number of final positions to plot, default all
     """
+    import plotting as p
+
     # Create figure
-    fig = plt.figure(figsize=(8, 8))
-    ax = fig.add_subplot(111, projection='3d')
+    ax = p.create_axes()
 
     # Plot sphere, points
-    h.plot_sphere(ax)
-    plot_option_one_run(ax, start_option, model_option)
-    h.plot_finish(ax, "Final positions of 100 particles")
+    p.plot_sphere(ax)
+    plot_option_one_run(ax, start_option, model_option, num_particles,
+                        max_points)
+    p.plot_finish(ax, f"Final positions of {num_particles} particles")
 
 def option_all_runs(start_option, model_option, num_particles = 100, runs = 50):
     """
@@ -136,6 +139,9 @@ def option_all_runs(start_option, model_option, num_particles = 100, runs = 50):
         num_particles: Number of particles to run in simulation, default 100
         runs: Number of runs of entire simulation
     """
+    # Extra library! All it does is create a progress bar in the terminal
+    from tqdm import tqdm
+
     # Track total number of destroyed and captured particles across all runs
     total_destroyed = 0
     total_captured = 0
@@ -143,30 +149,9 @@ def option_all_runs(start_option, model_option, num_particles = 100, runs = 50):
     # Run entire simulation a given number of times
     for _ in tqdm(range(runs)):
 
-        # Track number of destroyed and captured particles
-        n_destroyed = 0
-        n_captured = 0
-
-        # Run entire hopping journey for each particle
-        for _ in range(num_particles):
-            # Declare new instance of a particle
-            particle = Particle(start_option, model_option)
-
-            # In arbitrary large range, move particles
-            for _ in range(1000):
-                particle.move()
-                # Check for photodestruction
-                if particle.is_photodestroy():
-                    n_destroyed += 1
-                    break
-
-                # Check for capture
-                if particle.is_captured():
-                    n_captured += 1
-                    break
-
-                # Update particle conditions for next hop
-                particle.update_conditions()
+        # Run entire hopping journey for all particles at once
+        ensemble = ParticleEnsemble(start_option, model_option, num_particles)
+        n_destroyed, n_captured = ensemble.run()
 
         # Add to total photodestroyed and captured particles
         total_destroyed += n_destroyed
@@ -175,3 +160,79 @@ def option_all_runs(start_option, model_option, num_particles = 100, runs = 50):
     # Calcule total percentage captured and print
     perc_captured = total_captured / (total_captured + total_destroyed)
     print(f"Percentage captured: {perc_captured*100}%")
+
+def option_parallel_runs(start_option, model_option, num_particles = 100,
+                         runs = 50, seed = None, workers = None):
+    """
+    Do multiple (default fifty) runs of the entire simulation across a pool of
+    processes and find average proportion of particles captured
+
+    Args:
+        start_option: String specifying method of choosing initial positions
+        model_option: String for model - either Butler's 1993 or 1997 paper
+        num_particles: Number of particles to run in simulation, default 100
+        runs: Number of runs of entire simulation
+        seed: Integer seed for reproducible runs, default None
+        workers: Number of worker processes, default one per CPU
+    """
+    total_destroyed, total_captured = parallel_runs(
+        start_option, model_option, num_particles, runs, seed, workers)
+
+    # Calcule total percentage captured and print
+    perc_captured = total_captured / (total_captured + total_destroyed)
+    print(f"Percentage captured: {perc_captured*100}%")
+
+def option_cached_runs(start_option, model_option, num_particles = 100,
+                       runs = 50, seed = 0, workers = None,
+                       cache_dir = ".hop_cache"):
+    """
+    Do multiple (default fifty) seeded runs of the entire simulation, reusing
+    results cached by earlier calls, and find average proportion of particles
+    captured
+
+    Args:
+        start_option: String specifying method of choosing initial positions
+        model_option: String for model - either Butler's 1993 or 1997 paper
+        num_particles: Number of particles to run in simulation, default 100
+        runs: Number of runs of entire simulation
+        seed: Integer seed for reproducible runs, default 0
+        workers: Number of worker processes, default one per CPU
+        cache_dir: String path of directory of cached results
+    """
+    tally = ResultCache(cache_dir).tally(start_option, model_option,
+                                         num_particles, runs, seed, workers)
+
+    # Calcule total percentage captured and print
+    print(f"Percentage captured: {tally.perc_captured*100}%")
+
+def option_deposition_map(start_option, model_option, num_particles = 100,
+                          runs = 50, seed = None, workers = None,
+                          n_lat = 90, n_lon = 180):
+    """
+    Do multiple (default fifty) runs of the entire simulation and plot a map
+    of where particles were captured
+
+    Args:
+        start_option: String specifying method of choosing initial positions
+        model_option: String for model - either Butler's 1993 or 1997 paper
+        num_particles: Number of particles to run in simulation, default 100
+        runs: Number of runs of entire simulation
+        seed: Integer seed for reproducible runs, default None
+        workers: Number of worker processes, default one per CPU
+        n_lat: Number of latitude bins of map, default 90
+        n_lon: Number of longitude bins of map, default 180
+
+    Return:
+        DepositionMap of final positions of all particles
+    """
+    import plotting as p
+
+    tally = parallel_tally(start_option, model_option, num_particles, runs,
+                           seed, workers,
+                           accumulators=[DepositionMap(n_lat, n_lon)])
+    deposition = tally.accumulators[DepositionMap.name]
+
+    # Plot captured particles and show
+    p.plot_deposition_map(deposition)
+    p.plt.show()
+    return deposition
@@ -0,0 +1,148 @@
+"""
+Run independent simulation runs in parallel across a pool of processes
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from accumulators import Tally
+from engines import make_ensemble
+from random_stream import RandomStream
+from tables import get_tables
+
+def spawn_seeds(seed, runs):
+    """
+    Derive one independent seed per run from a single campaign seed
+
+    Args:
+        seed: Integer seed (or None for fresh entropy) for the whole campaign
+        runs: Number of runs to derive seeds for
+
+    Return:
+        List of numpy SeedSequence objects, one per run
+    """
+    return np.random.SeedSequence(seed).spawn(runs)
+
+def simulate_run(start_option, model_option, num_particles, seed_seq,
+                 photoloss_timescale=None, engine="spherical",
+                 accumulators=(), tabulate=None, max_hops=None):
+    """
+    Do one run of the simulation with its own random number generator
+
+    Args:
+        start_option: String specifying method of choosing initial positions
+        model_option: String for model - either Butler's 1993 or 1997 paper
+        num_particles: Number of particles to run in simulation
+        seed_seq: numpy SeedSequence used to seed the run's random numbers
+        photoloss_timescale: Timescale for photodestruction (s), default
+            helpers.PHOTOLOSS_TIMESCALE
+        engine: String name of engine in engines.ENGINES
+        accumulators: Iterable of accumulators (e.g. DepositionMap) whose
+            empty copies are filled with the run's particles
+        tabulate: Tolerance of lookup tables of hop conditions, default None
+            to calculate them exactly
+        max_hops: Optional safety limit on hops per particle, default None.
+            Particles still hopping at the limit are counted as truncated.
+
+    Return:
+        Tally of outcomes of the run
+    """
+    rng = RandomStream(seed_seq)
+    tables = None if tabulate is None else get_tables(model_option, tabulate)
+    ensemble = make_ensemble(engine, start_option, model_option,
+                             num_particles, rng, photoloss_timescale, tables)
+    ensemble.run(max_hops)
+    tally = Tally([acc.empty() for acc in accumulators])
+    tally.add_ensemble(ensemble)
+    return tally
+
+def _simulate_run(args):
+    """
+    Unpack arguments for simulate_run so it can be used with Executor.map
+    """
+    return simulate_run(*args)
+
+def parallel_tally(start_option, model_option, num_particles=100, runs=50,
+                   seed=None, workers=None, photoloss_timescale=None,
+                   engine="spherical", accumulators=(), tabulate=None,
+                   max_hops=None, skip=0):
+    """
+    Do multiple runs of the simulation across a pool of worker processes
+
+    Each run draws from its own random stream spawned from the campaign seed,
+    so a fixed seed gives identical totals regardless of the number of
+    workers. The first runs of a campaign get the same streams whatever the
+    total number of runs, so a campaign can be extended by skipping the runs
+    already done and merging the tallies.
+
+    Args:
+        start_option: String specifying method of choosing initial positions
+        model_option: String for model - either Butler's 1993 or 1997 paper
+        num_particles: Number of particles to run in simulation, default 100
+        runs: Number of runs of entire simulation, default 50
+        seed: Integer seed for the campaign, default None for fresh entropy
+        workers: Number of worker processes, default one per CPU. A value of
+            1 runs everything in the current process.
+        photoloss_timescale: Timescale for photodestruction (s), default
+            helpers.PHOTOLOSS_TIMESCALE
+        engine: String name of engine in engines.ENGINES
+        accumulators: Iterable of accumulators (e.g. DepositionMap) whose
+            empty copies are filled across all runs
+        tabulate: Tolerance of lookup tables of hop conditions, default None
+            to calculate them exactly. Tables are built once per process.
+        max_hops: Optional safety limit on hops per particle, default None.
+            Particles still hopping at the limit are counted as truncated.
+        skip: Number of runs at the start of the campaign not to do, e.g.
+            because they were done before, default 0
+
+    Return:
+        Tally of outcomes of the runs done
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    accumulators = tuple(accumulators)
+    tasks = [(start_option, model_option, num_particles, seed_seq,
+              photoloss_timescale, engine, accumulators, tabulate, max_hops)
+             for seed_seq in spawn_seeds(seed, runs)[skip:]]
+    total = Tally([acc.empty() for acc in accumulators])
+
+    # Run in this process if only one worker, skipping pool startup
+    if workers == 1:
+        return reduce_tallies(total, map(_simulate_run, tasks))
+
+    # Hand out runs in chunks so each worker gets a few at a time
+    chunksize = max(1, len(tasks) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(_simulate_run, tasks, chunksize=chunksize)
+        return reduce_tallies(total, results)
+
+def parallel_runs(start_option, model_option, num_particles=100, runs=50,
+                  seed=None, workers=None, photoloss_timescale=None,
+                  engine="spherical"):
+    """
+    Do multiple runs of the simulation across a pool of worker processes
+
+    Same as parallel_tally, but only returns the counts.
+
+    Return:
+        Tuple of total number of particles destroyed and captured
+    """
+    tally = parallel_tally(start_option, model_option, num_particles, runs,
+                           seed, workers, photoloss_timescale, engine)
+    return tally.destroyed, tally.captured
+
+def reduce_tallies(total, results):
+    """
+    Merge tallies from many runs into one
+
+    Args:
+        total: Tally to merge into
+        results: Iterable of tallies from runs
+
+    Return:
+        The total Tally
+    """
+    for tally in results:
+        total.merge(tally)
+    return total
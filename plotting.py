@@ -0,0 +1,220 @@
+"""
+Plotting functions for the simulation
+
+Kept apart from helpers.py so the physics can be imported without loading
+matplotlib, which is slow to import.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from ensemble import HOPPING, DESTROYED, CAPTURED
+import helpers as h
+
+# Color of final positions for each fate of particle
+FATE_COLORS = {HOPPING: 'r', DESTROYED: 'g', CAPTURED: 'b'}
+
+def create_axes():
+    """
+    Create a new figure with 3-D axes
+
+    Return:
+        Axes on which to plot
+    """
+    fig = plt.figure(figsize=(8, 8))
+    return fig.add_subplot(111, projection='3d')
+
+@lru_cache(maxsize=None)
+def sphere_mesh():
+    """
+    Build the mesh of a unit sphere and the circles around the poles
+
+    Cached, since it is the same for every plot.
+
+    Return:
+        Tuple of x, y, z arrays of sphere mesh and the x, y, z arrays of the
+        two polar circles
+    """
+    # Create a meshgrid of phi and beta values
+    phi, beta = np.mgrid[0.0:2.0*np.pi:100j, 0.0:np.pi:50j]
+
+    # Convert to cartesian
+    sphere = h.coord_converter(beta, phi)
+
+    # Two circles representing poles from Butler 1993
+    circle_beta = np.linspace(0, 2*np.pi, 100)
+    circle1_phi = np.full(100, h.PHI_POLE)
+    circle2_phi = np.full(100, np.pi - h.PHI_POLE)
+    return (sphere, h.coord_converter(circle1_phi, circle_beta),
+            h.coord_converter(circle2_phi, circle_beta))
+
+def plot_sphere(ax):
+    """
+    Plot a unit sphere in 3-D space
+
+    Arg:
+        ax: Axes on which to plot
+    """
+    (x, y, z), circle1, circle2 = sphere_mesh()
+
+    # Plot the 3D sphere in blue color
+    ax.plot_surface(x, y, z, color='#EEEEEE', alpha=0.5, linewidth=0)
+
+    # Plot two circles representing poles from Butler 1993
+    ax.plot(*circle1)
+    ax.plot(*circle2)
+
+def plot_points(ax, phi, beta, color='r', size=10):
+    """
+    Plot points on a sphere
+
+    Arg:
+        ax: Axes on which to plot
+        phi: Float or array of polar spherical coordinates (radians)
+        beta: Float or array of azimuthal spherical coordinates (radians)
+        color: Character for color of points, default red
+        size: Float size of markers, default 10
+    """
+    ax.scatter(*h.coord_converter(phi, beta), color=color, s = size)
+
+def subsample(count, max_points, rng=None):
+    """
+    Choose which of many points to plot
+
+    Args:
+        count: Number of points available
+        max_points: Maximum number of points to plot, or None for all
+        rng: Optional RandomStream or Generator, default global state
+
+    Return:
+        Array of indices of points to plot
+    """
+    if max_points is None or count <= max_points:
+        return np.arange(count)
+    order = np.argsort(h.get_rng(rng).uniform(0, 1, count))
+    return np.sort(order[:max_points])
+
+def plot_final_positions(ax, phi, beta, fate, max_points=None, rng=None):
+    """
+    Plot final positions of particles, colored by fate
+
+    Each fate is drawn as a single scatter, so even very large ensembles
+    only create three artists.
+
+    Arg:
+        ax: Axes on which to plot
+        phi: Array of polar spherical coordinates (radians)
+        beta: Array of azimuthal spherical coordinates (radians)
+        fate: Array of fate codes from ensemble.py
+        max_points: Maximum number of points to plot, randomly subsampled,
+            default None for all
+        rng: Optional RandomStream or Generator used for subsampling
+    """
+    idx = subsample(len(phi), max_points, rng)
+    phi, beta, fate = phi[idx], beta[idx], fate[idx]
+
+    # Smaller markers when there are many points
+    size = 10 if len(idx) <= 1000 else 1
+    for code, color in FATE_COLORS.items():
+        mask = fate == code
+        if np.any(mask):
+            plot_points(ax, phi[mask], beta[mask], color=color, size=size)
+
+def plot_journey(ax, phi, beta, fate, max_labels=100):
+    """
+    Plot journey of a particle as one line through every hop
+
+    Arg:
+        ax: Axes on which to plot
+        phi: Array of polar spherical coordinates of every hop (radians)
+        beta: Array of azimuthal spherical coordinates of every hop (radians)
+        fate: Fate code of particle from ensemble.py
+        max_labels: Maximum number of hops labelled with their hop number
+    """
+    x, y, z = h.coord_converter(np.asarray(phi), np.asarray(beta))
+
+    # One line and one scatter for the path, then the final position
+    ax.plot(x, y, z, color='r', linewidth=0.5)
+    ax.scatter(x[:-1], y[:-1], z[:-1], color='r', s = 10)
+    ax.scatter(x[-1], y[-1], z[-1], color=FATE_COLORS[fate], s = 10)
+
+    # Label (evenly spaced) hops with their hop number
+    step = max(1, -(-(len(x) - 1) // max_labels))
+    for i in range(0, len(x) - 1, step):
+        ax.text(x[i], y[i], z[i], i, fontsize = 6)
+
+def plot_deposition_map(deposition, fate=CAPTURED, title=None):
+    """
+    Plot a deposition map as a heatmap of particles per steradian
+
+    Latitude is drawn on a sine scale so every cell has the same area on the
+    plot, as it does on the sphere.
+
+    Arg:
+        deposition: DepositionMap to plot
+        fate: Fate code from ensemble.py, default CAPTURED
+        title: String for the title of the figure, default from fate
+
+    Return:
+        Axes of the plot
+    """
+    fig, ax = plt.subplots(figsize=(10, 5))
+    lat_edges = np.sin(np.deg2rad(deposition.latitude_edges()))
+    mesh = ax.pcolormesh(deposition.longitude_edges(), lat_edges,
+                         deposition.density(fate), shading='flat')
+    fig.colorbar(mesh, ax=ax, label='Particles per steradian')
+
+    # Label latitude ticks in degrees
+    ticks = np.arange(-90, 91, 30)
+    ax.set_yticks(np.sin(np.deg2rad(ticks)))
+    ax.set_yticklabels([f"{tick}" for tick in ticks])
+    ax.set_xlabel('Longitude (degrees)')
+    ax.set_ylabel('Latitude (degrees)')
+    if title is None:
+        title = "Final positions of " + \
+            {HOPPING: "hopping", DESTROYED: "destroyed",
+             CAPTURED: "captured"}[fate] + " particles"
+    ax.set_title(title)
+    return ax
+
+def plot_timeline(timeline, title="Fates of particles over time"):
+    """
+    Plot cumulative particles captured and destroyed, and particles still in
+    flight, against time of flight
+
+    Arg:
+        timeline: Timeline to plot
+        title: String for the title of the figure
+
+    Return:
+        Axes of the plot
+    """
+    fig, ax = plt.subplots(figsize=(10, 5))
+    hours = timeline.time_edges()[1:] / 3600
+    ax.plot(hours, timeline.cumulative(CAPTURED), 'b', label='Captured')
+    ax.plot(hours, timeline.cumulative(DESTROYED), 'g', label='Destroyed')
+    ax.plot(hours, timeline.in_flight(), 'r', label='In flight')
+    ax.set_xlabel('Time of flight (hours)')
+    ax.set_ylabel('Number of particles')
+    ax.legend()
+    ax.set_title(title)
+    return ax
+
+def plot_finish(ax, title):
+    """
+    Finish up a plot in 3-D space
+
+    Arg:
+        ax: Axes on which to plot
+        title: String for the title of the figure
+    """
+    # Set labels and title
+    ax.set_xlabel('X')
+    ax.set_ylabel('Y')
+    ax.set_zlabel('Z')
+    ax.set_title(title)
+
+    # Show the plot
+    plt.show()
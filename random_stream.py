@@ -0,0 +1,136 @@
+"""
+Buffered source of random numbers drawn from a numpy Generator in blocks
+"""
+import numpy as np
+
+class _Block:
+    """
+    One buffered block of random numbers of a single kind
+
+    Attributes:
+        values: Array of values in the block
+        scalars: Same values as a list of Python floats, for fast single draws
+        position: Index of next value to hand out
+    """
+    def __init__(self):
+        self.values = np.zeros(0)
+        self.scalars = []
+        self.position = 0
+
+    def fill(self, values, position=0):
+        """
+        Replace the block with new values
+        """
+        self.values = values
+        self.scalars = values.tolist()
+        self.position = position
+
+class RandomStream:
+    """
+    Hands out random numbers from large pre-generated blocks
+
+    Drawing single values from a numpy Generator has a lot of overhead per
+    call, so this draws a large block at a time and hands out values from it,
+    refilling when it runs out. It has the same uniform and standard_normal
+    methods as a Generator, so it can be used anywhere one is expected.
+
+    Attributes:
+        generator: numpy Generator that blocks are drawn from
+        block_size: Number of values drawn per block
+    """
+    def __init__(self, seed=None, block_size=2**16):
+        """
+        Args:
+            seed: Integer seed, SeedSequence or Generator, default None for
+                fresh entropy
+            block_size: Number of values drawn per block, default 65536
+        """
+        if isinstance(seed, np.random.Generator):
+            self.generator = seed
+        else:
+            self.generator = np.random.default_rng(seed)
+        self.block_size = block_size
+        self._uniform = _Block()
+        self._normal = _Block()
+
+    def _take(self, block, draw, count):
+        """
+        Take values from a block, refilling it from the Generator if needed
+
+        Args:
+            block: _Block to take values from
+            draw: Generator method that draws new values
+            count: Number of values to take
+
+        Return:
+            Array of values
+        """
+        position = block.position
+        remaining = block.values.size - position
+
+        # Values left in current block
+        if count <= remaining:
+            block.position = position + count
+            return block.values[position:position + count]
+
+        # Use up current block, then draw rest along with a new block
+        old = block.values[position:]
+        extra = count - remaining
+        block.fill(draw(extra + self.block_size), extra)
+        if remaining == 0:
+            return block.values[:extra]
+        return np.concatenate([old, block.values[:extra]])
+
+    def random(self, size=None):
+        """
+        Draw uniform random numbers between 0 and 1
+
+        Args:
+            size: Optional integer or tuple shape, default None for one float
+
+        Return:
+            Float or array of floats
+        """
+        block = self._uniform
+        if size is None or size == ():
+            # Fast path for a single value
+            if block.position < len(block.scalars):
+                block.position += 1
+                return block.scalars[block.position - 1]
+            return float(self._take(block, self.generator.random, 1)[0])
+        count = size if isinstance(size, int) else int(np.prod(size))
+        return self._take(block, self.generator.random, count).reshape(size)
+
+    def uniform(self, low=0.0, high=1.0, size=None):
+        """
+        Draw uniform random numbers between low and high
+
+        Args:
+            low: Float lower bound, default 0
+            high: Float upper bound, default 1
+            size: Optional integer or tuple shape, default None for one float
+
+        Return:
+            Float or array of floats
+        """
+        return low + (high - low) * self.random(size)
+
+    def standard_normal(self, size=None):
+        """
+        Draw random numbers from the standard normal distribution
+
+        Args:
+            size: Optional integer or tuple shape, default None for one float
+
+        Return:
+            Float or array of floats
+        """
+        block = self._normal
+        draw = self.generator.standard_normal
+        if size is None or size == ():
+            if block.position < len(block.scalars):
+                block.position += 1
+                return block.scalars[block.position - 1]
+            return float(self._take(block, draw, 1)[0])
+        count = size if isinstance(size, int) else int(np.prod(size))
+        return self._take(block, draw, count).reshape(size)
@@ -0,0 +1,149 @@
+"""
+Stream the hops of every particle to a compact file on disk
+
+Records are appended to a raw binary file of RECORD_DTYPE structs through a
+fixed-size buffer, so memory stays bounded however many hops are recorded.
+The file can be read back with load_trajectories without loading it into
+memory.
+
+Example:
+    with TrajectoryRecorder("hops.bin") as recorder:
+        ensemble = ParticleEnsemble("random", "1997", 1000)
+        recorder.watch(ensemble)
+        ensemble.run()
+    hops = load_trajectories("hops.bin")
+"""
+import numpy as np
+
+# One record per particle per hop, with the time the hop took (hop 0 is the
+# starting position, with a hop time of zero)
+RECORD_DTYPE = np.dtype([
+    ("particle", np.int64),
+    ("hop", np.int32),
+    ("phi", np.float64),
+    ("beta", np.float64),
+    ("hop_time", np.float64),
+    ("fate", np.int8),
+])
+
+class TrajectoryRecorder:
+    """
+    Streams per-hop records of particles to an append-only binary file
+
+    Attributes:
+        path: String path of file records are appended to
+        chunk_size: Number of records buffered before writing to file
+        n_records: Number of records recorded so far
+        next_id: Particle id given to the first particle of the next ensemble
+    """
+    def __init__(self, path, chunk_size=2**16, append=False):
+        """
+        Args:
+            path: String path of file to write
+            chunk_size: Number of records buffered before writing to file
+            append: Whether to append to an existing file, default False
+        """
+        self.path = path
+        self.chunk_size = chunk_size
+        self.n_records = 0
+        self.next_id = 0
+        self._buffer = np.empty(chunk_size, dtype=RECORD_DTYPE)
+        self._n_buffered = 0
+        self._file = open(path, "ab" if append else "wb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def watch(self, ensemble):
+        """
+        Record the starting positions of an ensemble and every later hop
+
+        Particles are given ids following on from earlier ensembles, so
+        several runs can be recorded to the same file.
+
+        Args:
+            ensemble: Ensemble of particles that has not started hopping
+        """
+        ensemble.recorder = self
+        ensemble.recorder_offset = self.next_id
+        self.next_id += len(ensemble)
+
+        idx = np.arange(len(ensemble))
+        self.write(ensemble.recorder_offset + idx, ensemble.hops,
+                   ensemble.phi, ensemble.beta, np.zeros(len(ensemble)),
+                   ensemble.fate)
+
+    def record(self, ensemble, idx):
+        """
+        Record particles of an ensemble that have just hopped
+
+        Args:
+            ensemble: Ensemble of particles being recorded
+            idx: Array of indices of particles to record
+        """
+        self.write(ensemble.recorder_offset + idx,
+                   ensemble.hops[idx], ensemble.phi[idx], ensemble.beta[idx],
+                   ensemble.hop_time[idx], ensemble.fate[idx])
+
+    def write(self, particle, hop, phi, beta, hop_time, fate):
+        """
+        Add records to the buffer, writing to file whenever it fills up
+
+        Args:
+            particle: Array of particle ids
+            hop: Array of hop numbers
+            phi: Array of polar spherical coordinates (radians)
+            beta: Array of azimuthal spherical coordinates (radians)
+            hop_time: Array of times taken by each hop (s)
+            fate: Array of fate codes from ensemble.py
+        """
+        count = len(particle)
+        start = 0
+        while start < count:
+            # Fill as much of the buffer as possible
+            size = min(count - start, self.chunk_size - self._n_buffered)
+            chunk = self._buffer[self._n_buffered:self._n_buffered + size]
+            chunk["particle"] = particle[start:start + size]
+            chunk["hop"] = hop[start:start + size]
+            chunk["phi"] = phi[start:start + size]
+            chunk["beta"] = beta[start:start + size]
+            chunk["hop_time"] = hop_time[start:start + size]
+            chunk["fate"] = fate[start:start + size]
+            self._n_buffered += size
+            start += size
+
+            if self._n_buffered == self.chunk_size:
+                self.flush()
+        self.n_records += count
+
+    def flush(self):
+        """
+        Write buffered records to file
+        """
+        self._file.write(self._buffer[:self._n_buffered].tobytes())
+        self._file.flush()
+        self._n_buffered = 0
+
+    def close(self):
+        """
+        Write remaining records and close the file
+        """
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+def load_trajectories(path):
+    """
+    Open a file of recorded hops without loading it into memory
+
+    Args:
+        path: String path of file written by TrajectoryRecorder
+
+    Return:
+        Read-only numpy memmap of RECORD_DTYPE records, in the order they
+        were recorded
+    """
+    return np.memmap(path, dtype=RECORD_DTYPE, mode="r")
@@ -0,0 +1,122 @@
+"""
+Proportion captured as a function of starting latitude
+
+Particles for every starting latitude are hopped together in one ensemble,
+labelled by the latitude they started from, so a whole response curve costs
+one batched run instead of one run per latitude. Each start can be a single
+point or a source spread around a site, such as exhaust from a landing.
+
+Example:
+    curve = response_curve([-70, -45, 0, 45, 70], "1997", 10000, seed=1)
+"""
+import numpy as np
+
+from adaptive import wilson_interval
+from engines import make_ensemble
+from ensemble import HOPPING, DESTROYED, CAPTURED
+from random_stream import RandomStream
+import helpers as h
+
+def site_positions(latitude, longitude=0.0, spread=0.0, size=None, rng=None):
+    """
+    Sample positions of particles released around a site
+
+    Positions are offset from the site in a random direction by an angle
+    whose components along the surface are Gaussian, as for exhaust spread
+    from a landing.
+
+    Args:
+        latitude: Float latitude of site in degrees, negative for south
+        longitude: Float longitude of site in degrees, default 0
+        spread: Float standard deviation of offset along each direction on
+            the surface in degrees, default 0 to release at the site
+        size: Optional integer number of positions, default None for one
+        rng: Optional RandomStream or Generator, default global state
+
+    Return:
+        Tuple of arrays (or floats) of phi and beta of each position
+    """
+    phi = h.latitude_to_phi(latitude)
+    beta = h.wrap(np.deg2rad(longitude))
+    if spread == 0:
+        shape = () if size is None else size
+        return np.zeros(shape) + phi, np.zeros(shape) + beta
+
+    # Project a random vector onto the plane tangent to the site, whose
+    # length is then Rayleigh distributed as for a 2-D Gaussian offset, and
+    # rotate the site by the offset angle towards it
+    x, y, z = h.coord_converter(phi, beta)
+    tangent = h.tangent_vector(x, y, z, h.get_rng(rng).standard_normal(
+        3 if size is None else (3, size)))
+    offset = np.deg2rad(spread) * tangent[3]
+    return h.cartesian_to_spherical(*h.rotate_towards(x, y, z, tangent,
+                                                      offset))
+
+def response_curve(latitudes, model_option, num_particles=1000, seed=None,
+                   photoloss_timescale=None, engine="spherical", tables=None,
+                   max_hops=None, spread=0.0, longitude=0.0,
+                   confidence=0.95):
+    """
+    Find the proportion captured from each of many starting latitudes
+
+    Args:
+        latitudes: Sequence of starting latitudes in degrees, negative for
+            south
+        model_option: String for model - either Butler's 1993 or 1997 paper
+        num_particles: Number of particles started from each latitude,
+            default 1000
+        seed: Integer seed for reproducible runs, default None
+        photoloss_timescale: Timescale for photodestruction (s), default
+            helpers.PHOTOLOSS_TIMESCALE
+        engine: String name of engine in engines.ENGINES
+        tables: Optional HopTables of the model, default exact hop conditions
+        max_hops: Optional safety limit on hops per particle, default None.
+            Particles still hopping at the limit are counted as truncated.
+        spread: Float standard deviation in degrees of the spread of
+            particles around each start, default 0 to start at a point
+        longitude: Float longitude of every start in degrees, default 0
+        confidence: Float confidence level of intervals, default 0.95
+
+    Return:
+        Dictionary of lists, one entry per latitude, of counts, proportion
+        captured, its standard error and confidence interval
+    """
+    latitudes = np.asarray(latitudes, dtype=float)
+    rng = RandomStream(seed)
+
+    # Label each particle with the index of the latitude it starts from
+    start = np.repeat(np.arange(latitudes.size), num_particles)
+    phi, beta = site_positions(latitudes[start], longitude, spread,
+                               start.size, rng)
+
+    # The fixed start option draws no positions, as they are set afterwards
+    ensemble = make_ensemble(engine, "seventy_deg_south", model_option,
+                             start.size, rng, photoloss_timescale, tables)
+    ensemble.set_positions(phi, beta)
+    ensemble.run(max_hops)
+
+    def count(fate):
+        return np.bincount(start[ensemble.fate == fate],
+                           minlength=latitudes.size)
+    destroyed, captured, truncated = (count(DESTROYED), count(CAPTURED),
+                                      count(HOPPING))
+
+    total = destroyed + captured
+    perc_captured = np.divide(captured, total, out=np.full(total.size, np.nan),
+                              where=total > 0)
+    std_error = np.sqrt(perc_captured * (1 - perc_captured) /
+                        np.maximum(total, 1))
+    intervals = [wilson_interval(int(c), int(n), confidence)
+                 for c, n in zip(captured, total)]
+    return {
+        "latitude": latitudes.tolist(),
+        "destroyed": destroyed.tolist(),
+        "captured": captured.tolist(),
+        "truncated": truncated.tolist(),
+        "perc_captured": [None if n == 0 else float(p)
+                          for p, n in zip(perc_captured, total)],
+        "std_error": [None if n == 0 else float(e)
+                      for e, n in zip(std_error, total)],
+        "interval": intervals,
+        "confidence": confidence,
+    }
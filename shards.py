@@ -0,0 +1,361 @@
+"""
+Split campaigns of many runs into shards that any process can run
+
+A campaign is planned into numbered shards of runs, written to a shared
+directory. Every run draws from its own random stream spawned from the
+campaign seed, as in parallel_tally, so a shard gives the same result
+whichever process or machine runs it, and merging every shard gives exactly
+the totals of parallel_tally with the same seed. Shards are claimed by
+creating a claim file, which only one process can do, so many processes can
+work through one directory with no coordinator.
+
+Example:
+    python shards.py plan campaign --model 1997 --runs 1000 --shards 50 \\
+        --seed 1
+    python shards.py run campaign        (on as many processes as wanted)
+    python shards.py merge campaign
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from accumulators import DepositionMap, Tally, Timeline
+from engines import ENGINES, supports_model
+from jit import stream_kind
+from models import MODELS
+from parallel import _simulate_run, reduce_tallies, spawn_seeds
+
+PLAN_NAME = "plan.json"
+START_OPTIONS = ("random", "seventy_deg_south")
+
+def shard_path(directory, shard, suffix=".npz"):
+    """
+    Get the path of the result (or claim) file of a shard
+    """
+    return os.path.join(directory, f"shard-{shard:05d}{suffix}")
+
+def plan_campaign(directory, start_option, model_option, num_particles=100,
+                  runs=50, shards=10, seed=None, photoloss_timescale=None,
+                  engine="spherical", map_bins=None, tabulate=None,
+                  max_hops=None, timeline=None):
+    """
+    Plan a campaign into shards of runs, saved to a shared directory
+
+    Args:
+        directory: String path of shared directory, created if needed
+        start_option: String specifying method of choosing initial positions
+        model_option: String for model - either Butler's 1993 or 1997 paper
+        num_particles: Number of particles per run, default 100
+        runs: Number of runs in the whole campaign, default 50
+        shards: Number of shards to split runs into, default 10
+        seed: Integer seed for the campaign, default None for fresh entropy
+        photoloss_timescale: Timescale for photodestruction (s), default
+            helpers.PHOTOLOSS_TIMESCALE
+        engine: String name of engine in engines.ENGINES
+        map_bins: Optional (n_lat, n_lon) of a deposition map to fill,
+            default None for no map
+        tabulate: Tolerance of lookup tables of hop conditions, default None
+            to calculate them exactly
+        max_hops: Optional safety limit on hops per particle, default None
+        timeline: Optional (n_bins, t_max, n_lat) of a timeline to fill, as
+            in accumulators.Timeline, default None for no timeline
+
+    Return:
+        Dictionary of the plan
+    """
+    # Check settings now, rather than in every worker that runs a shard
+    if start_option not in START_OPTIONS:
+        raise ValueError(f"start must be one of {START_OPTIONS}")
+    if str(model_option) not in MODELS:
+        raise ValueError(f"model must be one of {tuple(MODELS)}")
+    if engine not in ENGINES:
+        raise ValueError(f"engine must be one of {tuple(ENGINES)}")
+    if not supports_model(engine, str(model_option)):
+        raise ValueError(f"engine {engine} cannot run model {model_option}")
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, PLAN_NAME)
+    if os.path.exists(path):
+        raise ValueError(f"{directory} already has a campaign planned")
+
+    # Spread runs as evenly as possible between shards
+    edges = np.linspace(0, runs, min(shards, runs) + 1).round().astype(int)
+    plan = {
+        "settings": {
+            "start": start_option,
+            "model": str(model_option),
+            "particles": num_particles,
+            "runs": runs,
+            "photoloss_timescale": photoloss_timescale,
+            "engine": engine,
+            # The jit engine draws differently with and without numba, so
+            # every shard must run it the same way
+            "jit_stream": stream_kind() if engine == "jit" else None,
+            "map_bins": None if map_bins is None else list(map_bins),
+            "tabulate": tabulate,
+            "max_hops": max_hops,
+            "timeline": None if timeline is None else
+                        [int(timeline[0]), float(timeline[1]),
+                         int(timeline[2])],
+        },
+        "entropy": str(np.random.SeedSequence(seed).entropy),
+        "shards": [[int(low), int(high)]
+                   for low, high in zip(edges[:-1], edges[1:])],
+    }
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(plan, file, indent=2)
+    return plan
+
+def load_plan(directory):
+    """
+    Load the plan of a campaign saved by plan_campaign
+    """
+    with open(os.path.join(directory, PLAN_NAME), encoding="utf-8") as file:
+        return json.load(file)
+
+def plan_accumulators(plan):
+    """
+    Get empty accumulators filled by every shard of a plan
+    """
+    accumulators = []
+    map_bins = plan["settings"]["map_bins"]
+    if map_bins is not None:
+        accumulators.append(DepositionMap(*map_bins))
+    # Plans made before timelines existed have no timeline setting
+    timeline = plan["settings"].get("timeline")
+    if timeline is not None:
+        accumulators.append(Timeline(*timeline))
+    return tuple(accumulators)
+
+def check_jit_stream(plan):
+    """
+    Check this process runs the jit engine the way the plan recorded, since
+    it draws differently with and without numba
+    """
+    jit_stream = plan["settings"].get("jit_stream")
+    if jit_stream is not None and jit_stream != stream_kind():
+        raise ValueError(f"Campaign was planned for the {jit_stream} jit "
+                         f"engine, but this process has the "
+                         f"{stream_kind()} one")
+
+def run_shard(directory, shard, workers=1):
+    """
+    Run every run of one shard and save its result file
+
+    The result is written to a temporary file first, so a shard interrupted
+    while saving never leaves a partial result behind.
+
+    Args:
+        directory: String path of shared directory with the plan
+        shard: Integer number of shard to run
+        workers: Number of worker processes for the shard's runs, default 1
+
+    Return:
+        Tally of the shard
+    """
+    start_time = time.perf_counter()
+    plan = load_plan(directory)
+    settings = plan["settings"]
+    low, high = plan["shards"][shard]
+    accumulators = plan_accumulators(plan)
+    check_jit_stream(plan)
+
+    # Seeds are spawned for the whole campaign, so a run's seed does not
+    # depend on how runs are split into shards
+    seed_seqs = spawn_seeds(int(plan["entropy"]), settings["runs"])
+    tasks = [(settings["start"], settings["model"], settings["particles"],
+              seed_seqs[i], settings["photoloss_timescale"],
+              settings["engine"], accumulators, settings["tabulate"],
+              settings["max_hops"]) for i in range(low, high)]
+    total = Tally([acc.empty() for acc in accumulators])
+    if workers == 1:
+        reduce_tallies(total, map(_simulate_run, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            reduce_tallies(total, pool.map(_simulate_run, tasks))
+
+    path = shard_path(directory, shard)
+    # Temporary file is per process, in case a shard is run twice at once
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as file:
+        np.savez_compressed(
+            file, shard=shard, runs=np.array([low, high]),
+            wall_time=time.perf_counter() - start_time,
+            host=np.array(socket.gethostname()), **total.to_arrays())
+    os.replace(temp_path, path)
+    return total
+
+def claim_shard(directory, shard):
+    """
+    Claim a shard so no other process starts it
+
+    Return:
+        Boolean of whether the claim was made, False if already claimed
+    """
+    try:
+        descriptor = os.open(shard_path(directory, shard, ".claim"),
+                             os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(descriptor, "w") as file:
+        file.write(f"{socket.gethostname()} {os.getpid()}\n")
+    return True
+
+def run_pending(directory, workers=1):
+    """
+    Claim and run shards until none are left unclaimed
+
+    Claims are never released, so a shard whose process died stays claimed
+    and is reported missing by merge_shards. It can be run again with
+    run_shard.
+
+    Args:
+        directory: String path of shared directory with the plan
+        workers: Number of worker processes for each shard's runs, default 1
+
+    Return:
+        List of numbers of shards run by this process
+    """
+    # Check before claiming, so a mismatch leaves shards for other workers
+    plan = load_plan(directory)
+    check_jit_stream(plan)
+    done = []
+    for shard in range(len(plan["shards"])):
+        if os.path.exists(shard_path(directory, shard)):
+            continue
+        if claim_shard(directory, shard):
+            run_shard(directory, shard, workers)
+            done.append(shard)
+    return done
+
+def merge_shards(directory):
+    """
+    Merge the result files of every shard that has finished
+
+    Args:
+        directory: String path of shared directory with the plan
+
+    Return:
+        Tuple of the merged Tally and a dictionary with counts, proportion
+        captured, finished and missing shards, and total wall time of the
+        finished shards
+    """
+    plan = load_plan(directory)
+    total = Tally([acc.empty() for acc in plan_accumulators(plan)])
+    finished = []
+    missing = []
+    wall_time = 0.0
+    for shard in range(len(plan["shards"])):
+        path = shard_path(directory, shard)
+        if not os.path.exists(path):
+            missing.append(shard)
+            continue
+        with np.load(path) as arrays:
+            total.merge(Tally.from_arrays(arrays))
+            wall_time += float(arrays["wall_time"])
+        finished.append(shard)
+
+    runs = sum(high - low for low, high in
+               (plan["shards"][shard] for shard in finished))
+    return total, {
+        "destroyed": total.destroyed,
+        "captured": total.captured,
+        "truncated": total.truncated,
+        "perc_captured": total.perc_captured,
+        "runs": runs,
+        "finished": finished,
+        "missing": missing,
+        "wall_time": wall_time,
+    }
+
+def main(argv=None):
+    """
+    Plan, run or merge a sharded campaign from the command line
+
+    Args:
+        argv: List of argument strings, default sys.argv
+    """
+    parser = argparse.ArgumentParser(
+        description="Run campaigns as shards in a shared directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    plan = commands.add_parser("plan", help="plan a campaign into shards")
+    plan.add_argument("directory")
+    plan.add_argument("--start", default="random",
+                      choices=START_OPTIONS)
+    plan.add_argument("--model", default="1997", choices=tuple(MODELS))
+    plan.add_argument("--particles", type=int, default=100,
+                      help="number of particles per run")
+    plan.add_argument("--runs", type=int, default=50,
+                      help="number of runs in the whole campaign")
+    plan.add_argument("--shards", type=int, default=10,
+                      help="number of shards to split runs into")
+    plan.add_argument("--seed", type=int, help="seed for the campaign")
+    plan.add_argument("--photoloss-timescale", type=float,
+                      dest="photoloss_timescale")
+    plan.add_argument("--engine", default="spherical", choices=tuple(ENGINES))
+    plan.add_argument("--map-bins", type=int, nargs=2, dest="map_bins",
+                      metavar=("N_LAT", "N_LON"),
+                      help="fill a deposition map with these bins")
+    plan.add_argument("--tabulate", type=float, metavar="TOLERANCE")
+    plan.add_argument("--max-hops", type=int, dest="max_hops")
+    plan.add_argument("--timeline-bins", type=int, dest="timeline_bins",
+                      help="fill a timeline with this many time bins")
+    plan.add_argument("--timeline-max", type=float, default=30 * 86400,
+                      dest="timeline_max",
+                      help="time (s) of the end of the last timeline bin, "
+                           "default 30 days")
+    plan.add_argument("--timeline-lat", type=int, default=0,
+                      dest="timeline_lat",
+                      help="number of latitude bins of timeline, default "
+                           "none")
+
+    run = commands.add_parser("run", help="run unclaimed shards, or one "
+                                          "given shard")
+    run.add_argument("directory")
+    run.add_argument("--shard", type=int,
+                     help="run this shard even if claimed")
+    run.add_argument("--workers", type=int, default=1,
+                     help="number of worker processes per shard")
+
+    merge = commands.add_parser("merge", help="merge finished shards")
+    merge.add_argument("directory")
+    merge.add_argument("--map-output", dest="map_output",
+                       help="path of .npz merged deposition map")
+    merge.add_argument("--timeline-output", dest="timeline_output",
+                       help="path of .npz merged timeline")
+    args = parser.parse_args(argv)
+
+    if args.command == "plan":
+        timeline = None if args.timeline_bins is None else \
+            (args.timeline_bins, args.timeline_max, args.timeline_lat)
+        plan_campaign(args.directory, args.start, args.model, args.particles,
+                      args.runs, args.shards, args.seed,
+                      args.photoloss_timescale, args.engine, args.map_bins,
+                      args.tabulate, args.max_hops, timeline)
+    elif args.command == "run":
+        if args.shard is None:
+            shards = run_pending(args.directory, args.workers)
+        else:
+            run_shard(args.directory, args.shard, args.workers)
+            shards = [args.shard]
+        print(f"Ran shards {shards}")
+    else:
+        total, results = merge_shards(args.directory)
+        if args.map_output is not None and DepositionMap.name in \
+                total.accumulators:
+            total.accumulators[DepositionMap.name].save(args.map_output)
+        if args.timeline_output is not None and Timeline.name in \
+                total.accumulators:
+            total.accumulators[Timeline.name].save(args.timeline_output)
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
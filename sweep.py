@@ -0,0 +1,363 @@
+"""
+Sweep the proportion captured over grids of model parameters
+
+Every point of a sweep uses the same random streams (common random numbers),
+and each particle gets the same random numbers for each of its hops at every
+point, so differences between points are far less noisy than independent
+runs would give.
+
+Photodestruction is not simulated. Instead, each particle hops until it is
+captured and its total time of flight is recorded. Since a particle survives
+a hop of time t with probability exp(-t / timescale), weighting each captured
+particle by exp(-flight time / timescale) gives the proportion captured for
+any photoloss timescale from one set of trajectories.
+
+Example:
+    python sweep.py --model 1997 --photoloss-timescale 2000 6700 8300 \\
+        --t0 141 151 161 --output sweep.csv
+"""
+import argparse
+import csv
+import itertools
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ensemble import ParticleEnsemble, HOPPING, CAPTURED
+from models import Butler1993, Butler1997, get_model
+from parallel import spawn_seeds
+from random_stream import RandomStream
+import helpers as h
+
+# Parameters that change trajectories, each needing its own simulation
+TRAJECTORY_PARAMETERS = ("r_pole", "t_0", "t_1", "n", "angle_model")
+# Trajectory parameters that change each model
+MODEL_PARAMETERS = {
+    "1993": ("r_pole", "angle_model"),
+    "1997": ("t_0", "t_1", "n", "angle_model"),
+}
+# Default grid of every parameter
+DEFAULT_GRID = {
+    "photoloss_timescale": (h.PHOTOLOSS_TIMESCALE,),
+    "r_pole": (h.R_POLE,),
+    "t_0": (h.T_0,),
+    "t_1": (h.T_1,),
+    "n": (h.N,),
+    "angle_model": (None,),
+}
+# Flight times longer than this many of the longest timescale have
+# negligible weight (below 1e-13), so particles are dropped from then on
+CUTOFF = 30
+# Labels of where in a hop random numbers are drawn, so each gets its own
+MOVE_SITE = 0
+CAPTURE_SITE = 1
+LAUNCH_SITE = 2
+
+class SweepEnsemble(ParticleEnsemble):
+    """
+    Ensemble with a given model, hopping particles until captured
+
+    Random numbers of each hop are decided by the particle and its hop
+    number (see KeyedDraw) rather than drawn in turn from a stream, so the
+    same particle sees the same random numbers at every point of a sweep
+    however many particles are still hopping.
+
+    Attributes:
+        key: Integer key of the ensemble's random numbers, drawn from rng
+        max_flight_time: Flight time (s) after which particles are dropped
+        angle_model: Model object whose launch angles are used
+    """
+    def __init__(self, start_option, model_option, num_particles, rng=None,
+                 max_flight_time=np.inf, angle_model=None):
+        self.angle_model = get_model(model_option if angle_model is None
+                                     else angle_model)
+        self.max_flight_time = max_flight_time
+        self.key = int(h.get_rng(rng).uniform(0, 1) * 2**53)
+        super().__init__(start_option, model_option, num_particles, rng,
+                         photoloss_timescale=np.inf)
+
+    def draw(self, idx, site):
+        """
+        Get a source of random numbers for particles idx at a site of a hop
+        (one of MOVE_SITE, CAPTURE_SITE and LAUNCH_SITE)
+        """
+        return KeyedDraw(self.key, idx, self.hops[idx], site)
+
+    def is_photodestroy(self, idx):
+        """
+        Drop particles that have flown for too long
+        """
+        return self.elapsed[idx] > self.max_flight_time
+
+    def is_captured(self, idx):
+        """
+        Check if particles have been captured at polar regions
+        """
+        return self.model.is_captured(self.phi[idx],
+                                      self.draw(idx, CAPTURE_SITE))
+
+    def move(self, idx):
+        """
+        Move particles to their new positions
+        """
+        delta = self.hop_delta(idx)
+        psi = self.draw(idx, MOVE_SITE).uniform(0, 2*np.pi)
+        phi_old = self.phi[idx]
+        self.update_phi(idx, delta, psi)
+        self.update_beta(idx, delta, phi_old, psi)
+        self.hops[idx] += 1
+
+    def update_conditions(self, idx):
+        """
+        Update the conditions for next hop
+        """
+        self.temp[idx] = self.model.temperature(self.phi[idx])
+        self.velocity[idx] = h.velocity_rms(self.mass, self.temp[idx])
+        self.launch_angle[idx] = self.angle_model.launch_angle(
+            idx.size, self.draw(idx, LAUNCH_SITE))
+        self.hop_time[idx] = h.time_per_hop(self.velocity[idx],
+                                            self.launch_angle[idx])
+
+def _mix(x):
+    """
+    Scramble an array of 64-bit unsigned integers (the SplitMix64 finalizer),
+    a one-to-one map that turns nearby inputs into unrelated outputs
+    """
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+class KeyedDraw:
+    """
+    Source of uniform random numbers for some particles of an ensemble
+
+    Each number is a hash of the ensemble's key, the particle, its hop
+    number, where in the hop it is drawn and how many numbers were drawn
+    there before, so each particle always gets the same numbers whichever
+    other particles are still hopping. Only the given particles are drawn
+    for, so a step costs the same per live particle however few are left.
+    """
+    def __init__(self, key, idx, hops, site):
+        """
+        Args:
+            key: Integer key of the ensemble's random numbers
+            idx: Array of indices of particles to draw for
+            hops: Array of number of hops each particle has taken
+            site: Integer label of where in a hop the numbers are drawn
+        """
+        self.base = _mix(_mix(np.uint64(key) ^ idx.astype(np.uint64)) ^
+                         hops.astype(np.uint64))
+        self.site = site
+        self.calls = 0
+
+    def uniform(self, low=0, high=1, size=None):
+        """
+        Draw a uniform random number for each particle, ignoring size
+        """
+        counter = np.uint64(self.site * 2**32 + self.calls)
+        self.calls += 1
+        bits = _mix(self.base ^ counter) >> np.uint64(11)
+        return low + (high - low) * bits * 2.0**-53
+
+def build_model(model_option, r_pole=h.R_POLE, t_0=h.T_0, t_1=h.T_1, n=h.N):
+    """
+    Build the model for one point of a sweep
+
+    Args:
+        model_option: String for model - either Butler's 1993 or 1997 paper
+        r_pole: Radius of 1993 polar regions (m)
+        t_0, t_1, n: Parameters of 1997 thermal model
+
+    Return:
+        Model object from models.py
+    """
+    if str(model_option) == "1993":
+        return Butler1993(r_pole=r_pole)
+    if str(model_option) == "1997":
+        return Butler1997(t_0, t_1, n)
+    raise ValueError(f"Sweeps only run the models in "
+                     f"{tuple(MODEL_PARAMETERS)}")
+
+def weighted_sums(ensemble, timescales):
+    """
+    Total the weights of particles for each photoloss timescale
+
+    Args:
+        ensemble: Finished SweepEnsemble
+        timescales: Array of photoloss timescales (s)
+
+    Return:
+        (3, len(timescales)) array of sum of weights of captured particles,
+        sum of their squares, and sum of weights of particles still hopping
+    """
+    weights = np.exp(-ensemble.elapsed[:, None] / timescales)
+    captured = weights[ensemble.fate == CAPTURED]
+    hopping = weights[ensemble.fate == HOPPING]
+    return np.array([captured.sum(axis=0), np.square(captured).sum(axis=0),
+                     hopping.sum(axis=0)])
+
+def simulate_point(start_option, model_option, num_particles, seed_seq,
+                   timescales, params, max_hops):
+    """
+    Do one run of the simulation at one point of the trajectory parameters
+
+    Args:
+        start_option: String specifying method of choosing initial positions
+        model_option: String for model - either Butler's 1993 or 1997 paper
+        num_particles: Number of particles to run in simulation
+        seed_seq: numpy SeedSequence used to seed the run's random numbers
+        timescales: Array of photoloss timescales (s) to weight for
+        params: Dictionary of trajectory parameters of the model, as in
+            MODEL_PARAMETERS
+        max_hops: Integer maximum number of hops per particle
+
+    Return:
+        Array of weighted sums from weighted_sums
+    """
+    params = dict(params)
+    angle_model = params.pop("angle_model")
+    ensemble = SweepEnsemble(start_option,
+                             build_model(model_option, **params),
+                             num_particles, RandomStream(seed_seq),
+                             CUTOFF * np.max(timescales), angle_model)
+    ensemble.run(max_hops)
+    return weighted_sums(ensemble, timescales)
+
+def _simulate_point(args):
+    """
+    Unpack arguments for simulate_point so it can be used with Executor.map
+    """
+    return simulate_point(*args)
+
+def parameter_sweep(start_option, model_option, grid=None, num_particles=1000,
+                    runs=10, seed=None, workers=None, max_hops=100000):
+    """
+    Find proportion captured at every combination of parameters in a grid
+
+    Args:
+        start_option: String specifying method of choosing initial positions
+        model_option: String for model - either Butler's 1993 or 1997 paper
+        grid: Dictionary of sequences of values of parameters in
+            DEFAULT_GRID, which gives the values of missing parameters.
+            Trajectory parameters the model does not use (see
+            MODEL_PARAMETERS) are rejected.
+        num_particles: Number of particles per run, default 1000
+        runs: Number of runs at every point, default 10
+        seed: Integer seed shared by every point, default None
+        workers: Number of worker processes, default one per CPU. A value of
+            1 runs everything in the current process.
+        max_hops: Integer maximum number of hops per particle
+
+    Return:
+        List of dictionaries, one row per point with its parameters (the
+        photoloss timescale and those of the model), proportion captured (of
+        particles that were removed), its standard error and proportion still
+        hopping at the hop limit
+    """
+    grid = grid or {}
+    unknown = set(grid) - set(DEFAULT_GRID)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters: {sorted(unknown)}")
+    if str(model_option) not in MODEL_PARAMETERS:
+        raise ValueError(f"Sweeps only run the models in "
+                         f"{tuple(MODEL_PARAMETERS)}")
+    # Parameters the model ignores would only repeat the same simulation
+    parameters = MODEL_PARAMETERS[str(model_option)]
+    unused = set(grid) & set(TRAJECTORY_PARAMETERS) - set(parameters)
+    if unused:
+        raise ValueError(f"The {model_option} model does not use sweep "
+                         f"parameters {sorted(unused)}")
+    grid = {**DEFAULT_GRID, **grid}
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    # Simulate every point of the trajectory parameters with the same seeds
+    timescales = np.asarray(grid["photoloss_timescale"], dtype=float)
+    points = [dict(zip(parameters, values)) for values in
+              itertools.product(*(grid[key] for key in parameters))]
+    seed_seqs = spawn_seeds(seed, runs)
+    tasks = [(start_option, model_option, num_particles, seed_seq, timescales,
+              params, max_hops) for params in points for seed_seq in seed_seqs]
+    if workers == 1:
+        sums = list(map(_simulate_point, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            sums = list(pool.map(_simulate_point, tasks,
+                                 chunksize=max(1, len(tasks) // (4*workers))))
+
+    # Total the runs of each point, then make a row per timescale
+    total = num_particles * runs
+    rows = []
+    for i, params in enumerate(points):
+        captured, squares, hopping = np.sum(sums[i*runs:(i+1)*runs], axis=0)
+        removed = total - hopping
+        for j, timescale in enumerate(timescales):
+            mean = captured[j] / total
+            std_error = np.sqrt(max(squares[j] / total - mean**2, 0) / total)
+            rows.append({
+                "photoloss_timescale": float(timescale),
+                **params,
+                "angle_model": params["angle_model"] or str(model_option),
+                "particles": total,
+                "perc_captured": captured[j] / removed[j],
+                "std_error": std_error * total / removed[j],
+                "truncated": hopping[j] / total,
+            })
+    return rows
+
+def write_table(rows, file):
+    """
+    Write rows of a sweep as CSV
+
+    Args:
+        rows: List of dictionaries from parameter_sweep
+        file: Open text file to write to
+    """
+    writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+
+def main(argv=None):
+    """
+    Run a parameter sweep from the command line
+
+    Args:
+        argv: List of argument strings, default sys.argv
+    """
+    parser = argparse.ArgumentParser(description="Sweep model parameters")
+    parser.add_argument("--start", default="random",
+                        choices=["random", "seventy_deg_south"])
+    parser.add_argument("--model", default="1997", choices=["1993", "1997"])
+    parser.add_argument("--particles", type=int, default=1000,
+                        help="number of particles per run")
+    parser.add_argument("--runs", type=int, default=10,
+                        help="number of runs at every point")
+    parser.add_argument("--seed", type=int, help="seed shared by every point")
+    parser.add_argument("--workers", type=int,
+                        help="number of worker processes")
+    parser.add_argument("--photoloss-timescale", type=float, nargs="+",
+                        dest="photoloss_timescale")
+    parser.add_argument("--r-pole", type=float, nargs="+", dest="r_pole")
+    parser.add_argument("--t0", type=float, nargs="+", dest="t_0")
+    parser.add_argument("--t1", type=float, nargs="+", dest="t_1")
+    parser.add_argument("--n", type=float, nargs="+")
+    parser.add_argument("--angle-model", nargs="+", dest="angle_model",
+                        choices=["1993", "1997"])
+    parser.add_argument("--output", help="path of CSV file, default stdout")
+    args = parser.parse_args(argv)
+
+    grid = {key: getattr(args, key) for key in DEFAULT_GRID
+            if getattr(args, key) is not None}
+    rows = parameter_sweep(args.start, args.model, grid, args.particles,
+                           args.runs, args.seed, args.workers)
+    if args.output is None:
+        write_table(rows, sys.stdout)
+    else:
+        with open(args.output, "w", newline="", encoding="utf-8") as file:
+            write_table(rows, file)
+
+if __name__ == "__main__":
+    main()
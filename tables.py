@@ -0,0 +1,218 @@
+"""
+Lookup tables for the hop conditions of a model
+
+Velocity only depends on phi, and hop time and arc length are the velocity
+times a function of launch angle, so all of them can be tabulated once on
+fine grids and served by linear interpolation instead of evaluating powers,
+square roots and trigonometric functions on every hop. Tables are refined
+until they match the exact functions to within a given tolerance.
+
+Example:
+    tables = HopTables("1997", tolerance=1e-3)
+    ensemble = ParticleEnsemble("random", "1997", 1000, tables=tables)
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from models import get_model
+import helpers as h
+
+class Table:
+    """
+    Function tabulated on an evenly spaced grid, linearly interpolated
+
+    Attributes:
+        low: Lowest value of the grid
+        high: Highest value of the grid
+        grid: Array of points the function is tabulated at
+        values: Array of values of the function at each point
+    """
+    def __init__(self, func, low, high, n_points):
+        """
+        Args:
+            func: Function to tabulate, taking and returning arrays
+            low: Lowest value of the grid
+            high: Highest value of the grid
+            n_points: Number of points in the grid
+        """
+        self.low = low
+        self.high = high
+        self.grid = np.linspace(low, high, n_points)
+        self.values = func(self.grid)
+        # Slope from each point to the next, zero after the last point
+        self._slopes = np.append(np.diff(self.values), 0)
+        self._scale = (n_points - 1) / (high - low)
+        self._last = n_points - 1
+
+    def __len__(self):
+        return self.grid.size
+
+    def __call__(self, x):
+        """
+        Interpolate the function at x, a float or an array
+        """
+        # Single floats are faster with plain Python arithmetic
+        if isinstance(x, float):
+            pos = (float(x) - self.low) * self._scale
+            i = min(int(pos), self._last)
+            return self.values.item(i) + (pos - i) * self._slopes.item(i)
+
+        # Index the grid directly, as points are evenly spaced
+        pos = (x - self.low) * self._scale
+        i = pos.astype(np.intp)
+        np.minimum(i, self._last, out=i)
+        return self.values[i] + (pos - i) * self._slopes[i]
+
+    def max_error(self, func):
+        """
+        Get largest error of the table relative to its largest value
+
+        Linear interpolation is least accurate halfway between grid points,
+        so the table is compared with the exact function there.
+
+        Args:
+            func: Exact function that was tabulated
+
+        Return:
+            Float of largest error divided by largest absolute value
+        """
+        midpoints = (self.grid[:-1] + self.grid[1:]) / 2
+        error = np.max(np.abs(self(midpoints) - func(midpoints)))
+        return error / max(np.max(np.abs(self.values)), np.finfo(float).tiny)
+
+def fit_table(func, low, high, tolerance, min_points=2**12 + 1,
+              max_points=2**23 + 1):
+    """
+    Tabulate a function on finer and finer grids until it is accurate enough
+
+    Args:
+        func: Function to tabulate, taking and returning arrays
+        low: Lowest value of the grid
+        high: Highest value of the grid
+        tolerance: Largest error allowed, relative to largest value
+        min_points: Number of points of first grid tried
+        max_points: Largest number of points allowed
+
+    Return:
+        Table accurate to within tolerance
+    """
+    n_points = min_points
+    while True:
+        table = Table(func, low, high, n_points)
+        if table.max_error(func) <= tolerance:
+            return table
+        if n_points >= max_points:
+            raise ValueError(f"Cannot tabulate to a tolerance of {tolerance} "
+                             f"with {max_points} points")
+        n_points = 2 * n_points - 1
+
+class HopTables:
+    """
+    Tabulated velocity, hop time and arc length of hops for one model
+
+    Attributes:
+        model: Model object from models.py that was tabulated
+        mass: Mass of molecule in kg
+        tolerance: Largest error allowed, relative to largest value
+        velocity: Table of emergent velocity (m/s) against phi
+        time_factor: Table of hop time per unit velocity against launch angle
+        delta_factor: Table of arc length (radians) per unit velocity squared
+            against launch angle
+    """
+    def __init__(self, model_option, tolerance=1e-3, mass=h.MASS_WATER):
+        """
+        Args:
+            model_option: String name of model in models.MODELS, or a model
+                object
+            tolerance: Largest error allowed, relative to largest value,
+                default 1e-3
+            mass: Mass of molecule in kg, default helpers.MASS_WATER
+        """
+        self.model = get_model(model_option)
+        if self.model.local_time:
+            raise ValueError("Hop conditions of local time models depend on "
+                             "more than phi, so cannot be tabulated")
+        self.mass = mass
+        self.tolerance = tolerance
+
+        # Errors of velocity add up when squared and multiplied by a factor,
+        # so each table is made four times as accurate as needed
+        table_tolerance = tolerance / 4
+        self.velocity = fit_table(self.exact_velocity, 0, np.pi,
+                                  table_tolerance)
+        self.time_factor = fit_table(lambda angle: h.time_per_hop(1, angle),
+                                     0, np.pi / 2, table_tolerance)
+        self.delta_factor = fit_table(lambda angle: h.get_delta(1, angle),
+                                      0, np.pi / 2, table_tolerance)
+
+    def exact_velocity(self, phi):
+        """
+        Calculate emergent velocity at phi without the table
+        """
+        return h.velocity_rms(self.mass, self.model.temperature(phi))
+
+    def conditions(self, phi):
+        """
+        Look up temperature (K) and emergent velocity (m/s) at phi
+        """
+        velocity = self.velocity(phi)
+        # Invert velocity_rms rather than tabulate temperature separately
+        temp = velocity * velocity * self.mass / (3 * h.BOLTZMANN)
+        return temp, velocity
+
+    def hop_time(self, velocity, launch_angle):
+        """
+        Look up time taken by hops (s), as in helpers.time_per_hop
+        """
+        return velocity * self.time_factor(launch_angle)
+
+    def delta(self, velocity, launch_angle):
+        """
+        Look up angle between start and end of hops, as in helpers.get_delta
+        """
+        return velocity * velocity * self.delta_factor(launch_angle)
+
+    def validate(self, num_samples=100000, seed=0):
+        """
+        Compare the tables with the exact functions at random points
+
+        Args:
+            num_samples: Number of random phi and launch angles to compare
+            seed: Integer seed for the random points
+
+        Return:
+            Dictionary of largest error of temperature, velocity, hop time
+            and arc length, each relative to its largest exact value
+        """
+        rng = np.random.default_rng(seed)
+        phi = rng.uniform(0, np.pi, num_samples)
+        angle = rng.uniform(0, np.pi / 2, num_samples)
+        temp, velocity = self.conditions(phi)
+        exact_temp = self.model.temperature(phi)
+        exact_velocity = h.velocity_rms(self.mass, exact_temp)
+        pairs = {
+            "temperature": (temp, exact_temp),
+            "velocity": (velocity, exact_velocity),
+            "hop_time": (self.hop_time(velocity, angle),
+                         h.time_per_hop(exact_velocity, angle)),
+            "delta": (self.delta(velocity, angle),
+                      h.get_delta(exact_velocity, angle)),
+        }
+        return {name: float(np.max(np.abs(table - exact)) /
+                            np.max(np.abs(exact)))
+                for name, (table, exact) in pairs.items()}
+
+@lru_cache(maxsize=None)
+def get_tables(model_option, tolerance):
+    """
+    Get tables for a named model, building them once per process
+
+    Args:
+        model_option: String name of model in models.MODELS
+        tolerance: Largest error allowed, relative to largest value
+
+    Return:
+        HopTables of the model
+    """
+    return HopTables(model_option, tolerance)
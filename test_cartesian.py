@@ -0,0 +1,15 @@
+"""
+Tests of the cartesian hop kernel against the spherical one
+"""
+import numpy as np
+import pytest
+
+from cartesian import compare_hop_kernels
+
+@pytest.mark.parametrize("model_option", ["1993", "1997"])
+@pytest.mark.parametrize("phi", [1e-4, np.pi / 2])
+def test_hop_distributions_match(model_option, phi):
+    # Fixed seed, so the test is reproducible
+    result = compare_hop_kernels(phi, model_option, 20000, seed=1)
+    assert result["phi"] < result["critical"]
+    assert result["distance"] < result["critical"]
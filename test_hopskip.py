@@ -0,0 +1,32 @@
+"""
+Tests of HopSkipEnsemble against the spherical engine
+"""
+import numpy as np
+
+from ensemble import ParticleEnsemble
+from hopskip import HopSkipEnsemble
+from models import Butler1993
+from random_stream import RandomStream
+
+def run_from(cls, phi, model, num_particles, seed):
+    """
+    Run an ensemble with every particle starting at phi
+    """
+    ensemble = cls("random", model, num_particles, RandomStream(seed))
+    ensemble.set_positions(phi, 0)
+    ensemble.run()
+    return ensemble
+
+def test_start_inside_polar_region():
+    # A cold surface has short hops, so hopskip would jump if allowed to
+    model = Butler1993(t_surface=10)
+    num_particles = 20000
+    spherical = run_from(ParticleEnsemble, 0.05, model, num_particles, 1)
+    hopskip = run_from(HopSkipEnsemble, 0.05, model, num_particles, 2)
+
+    # Particles inside a polar region are checked for capture after one hop
+    assert hopskip.hops.mean() < 1.1
+    p_1 = spherical.n_captured / num_particles
+    p_2 = hopskip.n_captured / num_particles
+    error = np.sqrt((p_1 * (1 - p_1) + p_2 * (1 - p_2)) / num_particles)
+    assert abs(p_1 - p_2) <= 4 * max(error, 1 / num_particles)
@@ -0,0 +1,169 @@
+"""
+Surface temperature tabulated by colatitude and local solar time
+
+The table covers phi from 0 to pi (grid points at both ends) and hour angle
+from the subsolar point, from 0 (noon) up to but not including 2*pi, which
+wraps around. Temperatures between grid points are interpolated bilinearly
+with direct indexing of the evenly spaced grids, so a lookup costs a few
+gathers per particle whatever the size of the table.
+
+Example:
+    table = ThermalTable.from_function(analytic_temperature)
+    temp = table(phi, hour_angle)
+"""
+from functools import lru_cache
+import math
+
+import numpy as np
+
+import helpers as h
+
+def analytic_temperature(phi, hour_angle, t_noon=h.T_NOON,
+                         t_night=h.T_NIGHT):
+    """
+    Simple model of lunar surface temperature by latitude and local time
+
+    The dayside is in radiative equilibrium with the sun, so it scales with
+    the fourth root of the cosine of the solar zenith angle. The nightside
+    stays at a constant temperature.
+
+    Args:
+        phi: Float or array of polar spherical coordinates (radians)
+        hour_angle: Float or array of angles from local noon (radians)
+        t_noon: Temperature at the subsolar point (K)
+        t_night: Temperature of the nightside (K)
+
+    Return:
+        Float or array of surface temperature (K)
+    """
+    cos_zenith = np.maximum(np.sin(phi) * np.cos(hour_angle), 0)
+    return t_night + (t_noon - t_night) * np.power(cos_zenith, 0.25)
+
+class ThermalTable:
+    """
+    Surface temperature on an evenly spaced grid of phi and hour angle
+
+    Attributes:
+        temperature: (n_phi, n_hour) array of temperatures (K) at each phi
+            and hour angle of the grid
+        n_phi: Number of grid points in phi, from 0 to pi
+        n_hour: Number of grid points in hour angle, from 0 to 2*pi
+            exclusive
+    """
+    def __init__(self, temperature):
+        """
+        Args:
+            temperature: (n_phi, n_hour) array of temperatures (K), with at
+                least two points in phi
+        """
+        self.temperature = np.asarray(temperature, dtype=float)
+        self.n_phi, self.n_hour = self.temperature.shape
+        self._phi_scale = (self.n_phi - 1) / np.pi
+        self._hour_scale = self.n_hour / (2 * np.pi)
+        # Hour indices wrap with a bit mask when n_hour is a power of two
+        self._hour_mask = self.n_hour - 1 \
+            if self.n_hour & (self.n_hour - 1) == 0 else None
+
+        # Coefficients of the bilinear function in each cell, so lookups
+        # gather from one index instead of four. Cells in the last column
+        # wrap around to hour angle 0.
+        corner = self.temperature
+        hour_next = np.roll(corner, -1, axis=1)
+        phi_next = np.vstack([corner[1:], corner[-1:]])
+        both_next = np.roll(phi_next, -1, axis=1)
+        self._constant = corner.ravel()
+        self._hour_slope = (hour_next - corner).ravel()
+        self._phi_slope = (phi_next - corner).ravel()
+        self._cross = (both_next - phi_next - hour_next + corner).ravel()
+
+    @classmethod
+    def from_function(cls, func, n_phi=181, n_hour=512):
+        """
+        Tabulate a function of phi and hour angle
+
+        Args:
+            func: Function taking arrays of phi and hour angle and returning
+                temperatures (K), such as analytic_temperature
+            n_phi: Number of grid points in phi, default 181 (1 degree)
+            n_hour: Number of grid points in hour angle, default 512 (under
+                3 minutes of local time). Powers of two are a little faster.
+
+        Return:
+            ThermalTable of the function
+        """
+        phi, hour_angle = np.meshgrid(np.linspace(0, np.pi, n_phi),
+                                      np.arange(n_hour) * 2 * np.pi / n_hour,
+                                      indexing="ij")
+        return cls(func(phi, hour_angle))
+
+    def __call__(self, phi, hour_angle):
+        """
+        Interpolate temperature (K) at phi and hour angle, floats or arrays
+        """
+        # Single values are faster with plain Python arithmetic
+        if np.ndim(phi) == 0 and np.ndim(hour_angle) == 0:
+            pos_phi = float(phi) * self._phi_scale
+            i = min(int(pos_phi), self.n_phi - 2)
+            pos_hour = float(hour_angle) * self._hour_scale
+            j = math.floor(pos_hour)
+            frac_phi, frac_hour = pos_phi - i, pos_hour - j
+            cell = i * self.n_hour + j % self.n_hour
+            return self._constant.item(cell) + frac_hour * (
+                self._hour_slope.item(cell) +
+                frac_phi * self._cross.item(cell)) + \
+                frac_phi * self._phi_slope.item(cell)
+
+        # Index the grids directly, reusing arrays to keep temporaries few
+        frac_phi = np.multiply(phi, self._phi_scale)
+        cell = frac_phi.astype(np.intp)
+        np.minimum(cell, self.n_phi - 2, out=cell)
+        frac_phi -= cell
+        frac_hour = np.multiply(hour_angle, self._hour_scale)
+        j = np.floor(frac_hour)
+        frac_hour -= j
+        j = j.astype(np.intp)
+        if self._hour_mask is None:
+            np.remainder(j, self.n_hour, out=j)
+        else:
+            j &= self._hour_mask
+        cell *= self.n_hour
+        cell += j
+
+        # Bilinear interpolation from the coefficients of each cell
+        temp = self._cross[cell]
+        temp *= frac_phi
+        temp += self._hour_slope[cell]
+        temp *= frac_hour
+        frac_phi *= self._phi_slope[cell]
+        temp += frac_phi
+        temp += self._constant[cell]
+        return temp
+
+    def zonal_mean(self, phi):
+        """
+        Interpolate temperature (K) averaged over local time at phi
+        """
+        return np.interp(phi, np.linspace(0, np.pi, self.n_phi),
+                         self.temperature.mean(axis=1))
+
+    def save(self, path):
+        """
+        Save the table to a .npz file
+        """
+        np.savez_compressed(path, temperature=self.temperature)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a table from a .npz file with a (n_phi, n_hour) temperature
+        array, such as one saved with save
+        """
+        with np.load(path) as arrays:
+            return cls(arrays["temperature"])
+
+@lru_cache(maxsize=None)
+def default_table():
+    """
+    Get the table of analytic_temperature, built once per process
+    """
+    return ThermalTable.from_function(analytic_temperature)